@@ -0,0 +1,186 @@
+import os
+import time
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from typing import List
+from ClassForm4 import Form4
+
+
+class ClusterScreener:
+    def __init__(self, window_days: int = 10, min_insiders: int = 3, min_usd: float = 0, codes: List[str] = None,
+                 parquet_path: str = 'system/form4/data', trading_data_path: str = 'system/trading-data') -> None:
+        """
+        Initializes a new instance of the ClusterScreener class, which flags tickers where several insiders bought within a short window.
+
+        Parameters:
+        window_days (int, optional): Length in calendar days of the window ending on each purchase date. Defaults to 10.
+        min_insiders (int, optional): Minimum number of distinct rptOwnerCik buying within the window. Defaults to 3.
+        min_usd (float, optional): Minimum total shares_value_usd bought within the window. Defaults to 0.
+        codes (List[str], optional): Transaction codes counted as purchases. Defaults to None, which counts 'P', open market purchases.
+        parquet_path (str, optional): The path of the Form 4 lake. Defaults to 'system/form4/data'.
+        trading_data_path (str, optional): The path of the trading-data lake. Defaults to 'system/trading-data'.
+        """
+        self.window_days = window_days
+        self.min_insiders = min_insiders
+        self.min_usd = min_usd
+        self.codes = codes if codes is not None else ['P']
+        self.parquet_path = parquet_path
+        self.trading_data_path = trading_data_path
+        # time of the last screen, used by screen_updated
+        self.last_screened = None
+
+    def load_purchases(self, ciks: List[str] = None, issuers: List[str] = None) -> pd.DataFrame:
+        """
+        Reads the purchases of the lake with their USD value.
+
+        Parameters:
+        ciks (List[str], optional): Parent CIKs to read. Defaults to None, which reads the whole lake.
+        issuers (List[str], optional): Issuer CIKs to read from every partition, including the reporting owners' ones. Defaults to None, which reads all issuers.
+
+        Returns:
+        DataFrame: One row per purchase.
+        """
+        Form4.check_system_data(self.parquet_path, ciks)
+        filters = None
+        if ciks is not None:
+            filters = [('parent_cik', 'in', [int(cik) for cik in ciks])]
+        if issuers is not None:
+            filters = (filters or []) + [('cik', 'in', [int(cik) for cik in issuers])]
+
+        df = pd.read_parquet(self.parquet_path, engine='pyarrow', schema=Form4.pa_schema, filters=filters,
+                             columns=sorted(set(['parent_cik', 'ticker', 'hash'] + Form4.transaction_key_columns),
+                                            key=Form4.pa_schema.names.index))
+        df = df[df['code'].astype(str).isin(self.codes) & (df['acquired_disposed_code'].astype(str) == 'A')]
+        df = df[df['ticker'].notnull() & df['rptOwnerCik'].notnull() & df['transaction_date'].notnull()]
+
+        if os.path.isdir(self.trading_data_path) and len(df) > 0:
+            pa_schema = pa.schema([
+                pa.field('parent_cik', pa.int64()),
+                pa.field('hash', pa.string()),
+                pa.field('shares_value_usd', pa.float64()),
+            ])
+            trading_data = pd.read_parquet(self.trading_data_path, engine='pyarrow', schema=pa_schema,
+                                           columns=['hash', 'shares_value_usd'],
+                                           filters=[('parent_cik', 'in', [int(cik) for cik in df['parent_cik'].unique()])])
+            df = df.merge(trading_data.drop_duplicates(subset=['hash']), how='left', on='hash')
+        else:
+            df['shares_value_usd'] = np.nan
+        # the same transaction can be filed under the issuer and the reporting owner, only one copy may be priced
+        df = Form4.drop_duplicate_filings(df, prefer=df['shares_value_usd'].notnull())
+
+        df['transaction_date'] = pd.to_datetime(df['transaction_date'])
+        return df.reset_index(drop=True)
+
+    def screen(self, purchases: pd.DataFrame = None, ciks: List[str] = None) -> pd.DataFrame:
+        """
+        Evaluates, for every ticker and purchase date, the distinct buyers and the USD bought in the window ending on that date.
+
+        Parameters:
+        purchases (DataFrame, optional): Purchases as returned by load_purchases. Defaults to None, which loads them.
+        ciks (List[str], optional): Parent CIKs to load when purchases is None. Defaults to None, which loads the whole lake.
+
+        Returns:
+        DataFrame: The flagged ticker/date windows with their 'insiders', 'purchases' and 'usd' totals.
+        """
+        if purchases is None:
+            purchases = self.load_purchases(ciks)
+        self.last_screened = time.time()
+        columns = ['ticker', 'transaction_date', 'insiders', 'purchases', 'usd']
+        if len(purchases) == 0:
+            return pd.DataFrame(columns=columns)
+
+        ticker_codes, tickers = pd.factorize(purchases['ticker'].astype(str))
+        owner_codes = pd.factorize(purchases['rptOwnerCik'])[0]
+        dates = purchases['transaction_date'].values.astype('datetime64[D]')
+        first_date = dates.min()
+        days = (dates - first_date).astype(np.int64)
+        usd = np.nan_to_num(purchases['shares_value_usd'].to_numpy(dtype=float))
+
+        # one key per ticker and day, spaced so that no window reaches the previous ticker
+        # a window of window_days days ending on a date starts window_days - 1 days before it
+        window = self.window_days - 1
+        span = days.max() + window + 2
+        keys = ticker_codes.astype(np.int64) * span + days
+        order = np.argsort(keys, kind='stable')
+        keys = keys[order]
+
+        # running totals of the purchases and their USD value
+        cum_usd = np.concatenate([[0.0], np.cumsum(usd[order])])
+        query_keys = np.unique(keys)
+        hi = np.searchsorted(keys, query_keys, side='right')
+        lo = np.searchsorted(keys, query_keys - window, side='left')
+        window_usd = cum_usd[hi] - cum_usd[lo]
+        window_purchases = hi - lo
+
+        # distinct owners: each (ticker, owner, day) counts from its day until the owner buys again
+        # or the window has passed, so the distinct count is the number of open intervals
+        pairs = np.unique(np.stack([ticker_codes.astype(np.int64), owner_codes.astype(np.int64), days], axis=1), axis=0)
+        same_pair = (pairs[1:, 0] == pairs[:-1, 0]) & (pairs[1:, 1] == pairs[:-1, 1])
+        next_day = np.where(np.concatenate([same_pair, [False]]),
+                            np.concatenate([pairs[1:, 2], [0]]), np.iinfo(np.int64).max)
+        interval_start = pairs[:, 0] * span + pairs[:, 2]
+        interval_end = pairs[:, 0] * span + np.minimum(next_day, pairs[:, 2] + window + 1)
+        window_insiders = np.searchsorted(np.sort(interval_start), query_keys, side='right') - \
+            np.searchsorted(np.sort(interval_end), query_keys, side='right')
+
+        result = pd.DataFrame({
+            'ticker': tickers[query_keys // span],
+            'transaction_date': first_date + (query_keys % span).astype('timedelta64[D]'),
+            'insiders': window_insiders,
+            'purchases': window_purchases,
+            'usd': window_usd,
+        }, columns=columns)
+        flagged = (result['insiders'] >= self.min_insiders) & (result['usd'] >= self.min_usd)
+        return result[flagged].reset_index(drop=True)
+
+    def updated_tickers(self, since: float) -> tuple:
+        """
+        Lists the tickers and issuers of the Parquet files written to the Form 4 lake after a given time.
+
+        Parameters:
+        since (float): A timestamp as returned by time.time().
+
+        Returns:
+        tuple: The tickers touched since then, and the issuer CIKs of the touched rows.
+        """
+        tickers = set()
+        ciks = set()
+        if not os.path.isdir(self.parquet_path):
+            return [], []
+        for partition in os.listdir(self.parquet_path):
+            partition_path = os.path.join(self.parquet_path, partition)
+            if not partition.startswith('parent_cik='):
+                continue
+            for file_name in os.listdir(partition_path):
+                file_path = os.path.join(partition_path, file_name)
+                if file_name.endswith('.parquet') and os.path.getmtime(file_path) > since:
+                    table = pq.read_table(file_path, columns=['ticker', 'cik'])
+                    tickers.update(t for t in table.column('ticker').to_pylist() if t)
+                    ciks.update(str(cik) for cik in table.column('cik').to_pylist() if cik is not None)
+        return sorted(tickers), sorted(ciks)
+
+    def screen_updated(self, since: float = None) -> pd.DataFrame:
+        """
+        Screens again only the tickers touched by the syncs since the last screen.
+
+        Parameters:
+        since (float, optional): A timestamp as returned by time.time(). Defaults to None, which uses the time of the last screen.
+
+        Returns:
+        DataFrame: The flagged windows of the touched tickers.
+        """
+        if since is None:
+            since = self.last_screened if self.last_screened is not None else 0
+        started = time.time()
+        tickers, ciks = self.updated_tickers(since)
+        if len(ciks) == 0:
+            self.last_screened = started
+            return self.screen(pd.DataFrame())
+        # the other purchases of the touched tickers can be filed under any partition, so read them by issuer
+        purchases = self.load_purchases(issuers=ciks)
+        purchases = purchases[purchases['ticker'].astype(str).isin(tickers)]
+        result = self.screen(purchases)
+        self.last_screened = started
+        return result
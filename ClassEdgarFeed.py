@@ -0,0 +1,206 @@
+import os
+import re
+import time
+import requests
+from collections import OrderedDict
+from typing import Dict, List
+from bs4 import BeautifulSoup
+from ClassForm4 import Form4
+
+
+class EdgarFeed:
+    # EDGAR "latest filings" Atom feed restricted to Form 4
+    feed_url = "https://www.sec.gov/cgi-bin/browse-edgar"
+
+    def __init__(self, ciks: List[str], feed_url: str = None, count: int = 100, max_pages: int = 10,
+                 max_seen: int = 100000) -> None:
+        """
+        Initializes a new instance of the EdgarFeed class.
+
+        Parameters:
+        ciks (List[str]): The CIK numbers of the issuers to keep fresh. With or without leading zeros.
+        feed_url (str, optional): The URL of the current-filings feed, or the path to a local Atom file. Defaults to the EDGAR feed.
+        count (int, optional): Number of entries requested per feed page. EDGAR caps it at 100. Defaults to 100.
+        max_pages (int, optional): Maximum number of feed pages read per poll. Defaults to 10.
+        max_seen (int, optional): Number of seen accessions remembered, oldest forgotten first. Defaults to 100000.
+        """
+        self.ciks = set(cik.lstrip('0') for cik in ciks)
+        if feed_url is not None:
+            self.feed_url = feed_url
+        self.count = count
+        self.max_pages = max_pages
+        self.max_seen = max_seen
+        # accession numbers already seen in previous polls, in the order they were seen
+        self.seen_accessions = OrderedDict()
+
+        # set headers to simulate browser request
+        self.headers = {
+            "Connection": "close",
+            "Accept": "application/json, text/javascript, */*; q=0.01",
+            "X-Requested-With": "XMLHttpRequest",
+            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/80.0.3987.163 Safari/537.36"
+        }
+
+    def read_feed(self, start: int = 0) -> str:
+        """
+        Reads one page of the current-filings feed.
+
+        Parameters:
+        start (int): The offset of the first entry of the page.
+
+        Returns:
+        str: The Atom document.
+        """
+        if os.path.exists(self.feed_url):
+            with open(self.feed_url, encoding='utf-8') as feed_file:
+                return feed_file.read()
+
+        params = {
+            "action": "getcurrent",
+            "type": "4",
+            "owner": "include",
+            "start": start,
+            "count": self.count,
+            "output": "atom"
+        }
+        id_try = True
+        while id_try == True:
+            response = requests.get(
+                self.feed_url, params=params, headers=self.headers)
+            if 'SEC.gov | Request Rate Threshold Exceeded' in response.text:
+                print(
+                    "Feed| Fail to read the latest filings due to SEC.gov Request Rate Threshold Exceeded. Retrying in 60 seg.")
+                time.sleep(60)
+            else:
+                id_try = False
+        return response.text
+
+    @ staticmethod
+    def parse_feed(feed: str) -> List[dict]:
+        """
+        Parses a current-filings Atom document into its Form 4 entries.
+
+        Parameters:
+        feed (str): The Atom document.
+
+        Returns:
+        List[dict]: A list of dictionaries with the 'cik', 'role' ('Issuer' or 'Reporting') and 'accession' of each entry.
+        """
+        soup = BeautifulSoup(feed, "lxml-xml")
+        entries = []
+        for entry in soup.find_all("entry"):
+            category_tag = entry.find("category")
+            form_type = category_tag.get("term", "") if category_tag else ""
+            if form_type not in ("4", "4/A"):
+                continue
+
+            title_tag = entry.find("title")
+            title = title_tag.text if title_tag else ""
+            match = re.search(r"\((\d+)\)\s*\((Issuer|Reporting)\)", title)
+            if not match:
+                continue
+
+            summary_tag = entry.find("summary")
+            summary = summary_tag.text if summary_tag else ""
+            accession = re.search(r"AccNo:\s*(?:<[^>]+>\s*)*([\d-]+)", summary)
+            if accession:
+                accession = accession.group(1)
+            else:
+                # fall back to the accession folder of the filing index link
+                link_tag = entry.find("link", href=True)
+                link = link_tag["href"] if link_tag else ""
+                accession = re.search(r"/(\d{18})/", link)
+                if not accession:
+                    continue
+                accession = accession.group(1)
+
+            entries.append({
+                "cik": match.group(1).lstrip('0'),
+                "role": match.group(2),
+                "accession": accession.replace('-', '')
+            })
+        return entries
+
+    def mark_seen(self, accessions: List[str]) -> None:
+        for accession in accessions:
+            self.seen_accessions[accession] = True
+            self.seen_accessions.move_to_end(accession)
+        while len(self.seen_accessions) > self.max_seen:
+            self.seen_accessions.popitem(last=False)
+
+    def get_new_operation_ids(self) -> Dict[str, List[str]]:
+        """
+        Reads the feed until it reaches entries seen in a previous poll and returns the new Form 4 accessions of the issuers in the universe.
+        The accessions returned are only marked as seen once they are scraped, so a failed scrape is retried at the next poll.
+
+        Returns:
+        Dict[str, List[str]]: The new operation IDs, keyed by issuer CIK.
+        """
+        entries = []
+        for page in range(self.max_pages):
+            page_entries = EdgarFeed.parse_feed(
+                self.read_feed(start=page * self.count))
+            entries.extend(page_entries)
+            reached_seen = any(
+                entry["accession"] in self.seen_accessions for entry in page_entries)
+            if reached_seen or len(page_entries) < self.count or os.path.exists(self.feed_url):
+                break
+
+        new_operation_ids = {}
+        for entry in entries:
+            if entry["accession"] in self.seen_accessions:
+                continue
+            if entry["role"] == "Issuer" and entry["cik"] in self.ciks:
+                new_operation_ids.setdefault(
+                    entry["cik"], []).append(entry["accession"])
+        # entries outside the universe are never scraped. The feed lists a filing under the issuer and the reporting
+        # owner with the same accession, so the other copies of a pending filing are marked once it is scraped
+        pending = set(accession for operation_ids in new_operation_ids.values()
+                      for accession in operation_ids)
+        self.mark_seen([entry["accession"] for entry in entries
+                        if entry["accession"] not in pending])
+
+        print(
+            f"Feed| Found {sum(len(ids) for ids in new_operation_ids.values())} new operations for {len(new_operation_ids)} CIKs.")
+        return new_operation_ids
+
+    def poll(self) -> Dict[str, Form4]:
+        """
+        Polls the feed once and scrapes and syncs only the new Form 4 filings of the issuers in the universe.
+
+        Returns:
+        Dict[str, Form4]: The Form4 instances created, keyed by issuer CIK.
+        """
+        form4s = {}
+        for cik, operation_ids in self.get_new_operation_ids().items():
+            try:
+                # driven step by step, so a failed sync is not swallowed and the filings are retried
+                form4 = Form4(cik, operation_ids=operation_ids, run=False)
+                for form4_link in form4.iter_form4_links():
+                    form4.get_form4_data(form4_link)
+                form4.sync_system_data()
+                form4s[cik] = form4
+            except Exception as e:
+                print(f"CIK: '{cik}'| Unable to scrape the new filings, retrying at the next poll: {e}")
+                continue
+            self.mark_seen(operation_ids)
+        return form4s
+
+    def watch(self, interval: int = 60, iterations: int = None) -> None:
+        """
+        Polls the feed once per interval.
+
+        Parameters:
+        interval (int, optional): Seconds between the start of two polls. Defaults to 60.
+        iterations (int, optional): Number of polls before returning. Defaults to None, which polls forever.
+        """
+        i = 0
+        while iterations is None or i < iterations:
+            start_time = time.time()
+            try:
+                self.poll()
+            except Exception as e:
+                print(f"Feed| Unable to poll the latest filings: {e}")
+            i += 1
+            if iterations is None or i < iterations:
+                time.sleep(max(0, interval - (time.time() - start_time)))
@@ -0,0 +1,178 @@
+import os
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from typing import List
+from ClassForm4 import Form4
+
+
+class EventStudy:
+    # upper bounds in USD of the transaction size buckets
+    size_bins = [0, 1e4, 1e5, 1e6, 1e7, np.inf]
+    size_labels = ['<10K', '10K-100K', '100K-1M', '1M-10M', '>10M']
+
+    def __init__(self, prices: pd.DataFrame = None, benchmark: str = None, horizons: List[int] = None,
+                 parquet_path: str = 'system/form4/data', trading_data_path: str = 'system/trading-data') -> None:
+        """
+        Initializes a new instance of the EventStudy class, which measures stock returns after insider transactions.
+
+        Parameters:
+        prices (DataFrame, optional): Daily adjusted close prices indexed by trading date with one column per ticker. Downloaded with yfinance when None. Defaults to None.
+        benchmark (str, optional): Column of the benchmark (e.g. 'SPY') used for abnormal returns. Defaults to None, which uses the equal-weighted mean of all the tickers.
+        horizons (List[int], optional): Trading days after the transaction to compute returns for. Defaults to None, which uses [1, 5, 20, 60].
+        parquet_path (str, optional): The path of the Form 4 lake. Defaults to 'system/form4/data'.
+        trading_data_path (str, optional): The path of the trading-data lake. Defaults to 'system/trading-data'.
+        """
+        self.prices = prices
+        self.benchmark = benchmark
+        self.horizons = horizons if horizons is not None else [1, 5, 20, 60]
+        self.parquet_path = parquet_path
+        self.trading_data_path = trading_data_path
+
+    def load_events(self, ciks: List[str] = None) -> pd.DataFrame:
+        """
+        Reads the insider transactions of the lake with their USD value.
+
+        Parameters:
+        ciks (List[str], optional): Parent CIKs to read. Defaults to None, which reads the whole lake.
+
+        Returns:
+        DataFrame: One row per transaction.
+        """
+        Form4.check_system_data(self.parquet_path, ciks)
+        filters = None
+        if ciks is not None:
+            filters = [('parent_cik', 'in', [int(cik) for cik in ciks])]
+
+        events = pd.read_parquet(self.parquet_path, engine='pyarrow', schema=Form4.pa_schema, filters=filters,
+                                 columns=sorted(set(['parent_cik', 'ticker', 'isOfficer', 'isDirector', 'hash'] +
+                                                    Form4.transaction_key_columns), key=Form4.pa_schema.names.index))
+        events['transaction_date'] = pd.to_datetime(
+            events['transaction_date'])
+
+        if os.path.isdir(self.trading_data_path):
+            pa_schema = pa.schema([
+                pa.field('parent_cik', pa.int64()),
+                pa.field('hash', pa.string()),
+                pa.field('shares_value_usd', pa.float64()),
+            ])
+            trading_data = pd.read_parquet(self.trading_data_path, engine='pyarrow', schema=pa_schema,
+                                           columns=['hash', 'shares_value_usd'], filters=filters)
+            events = events.merge(trading_data.drop_duplicates(subset=['hash']),
+                                  how='left', on='hash')
+        else:
+            events['shares_value_usd'] = np.nan
+        # the same transaction can be filed under the issuer and the reporting owner, only one copy may be priced
+        events = Form4.drop_duplicate_filings(events, prefer=events['shares_value_usd'].notnull())
+
+        return events.reset_index(drop=True)
+
+    @ staticmethod
+    def download_prices(tickers: List[str], start_date, end_date) -> pd.DataFrame:
+        """
+        Downloads the daily adjusted close prices of all the tickers in a single request.
+
+        Parameters:
+        tickers (List[str]): The tickers to download.
+        start_date: The first date to download.
+        end_date: The last date to download.
+
+        Returns:
+        DataFrame: Prices indexed by trading date with one column per ticker.
+        """
+        import yfinance as yf
+
+        history = yf.download(list(tickers), start=start_date,
+                              end=pd.Timestamp(end_date) + pd.Timedelta(days=1))
+        if isinstance(history.columns, pd.MultiIndex):
+            return history['Adj Close']
+        return history[['Adj Close']].rename(columns={'Adj Close': list(tickers)[0]})
+
+    def compute(self, events: pd.DataFrame = None) -> pd.DataFrame:
+        """
+        Computes the forward and abnormal returns of every transaction for each horizon.
+        The transaction is priced at the close of its date, or of the next trading day if the market was closed.
+
+        Parameters:
+        events (DataFrame, optional): Transactions with 'ticker' and 'transaction_date'. Defaults to None, which loads the whole lake.
+
+        Returns:
+        DataFrame: The events with the 'forward_return_<h>' and 'abnormal_return_<h>' columns added.
+        """
+        if events is None:
+            events = self.load_events()
+        events = events.copy()
+        tickers = events['ticker'].astype(str)
+
+        prices = self.prices
+        if prices is None:
+            download_tickers = [t for t in tickers.unique() if t not in ('', 'nan', 'None')]
+            if self.benchmark is not None:
+                download_tickers.append(self.benchmark)
+            max_horizon = pd.tseries.offsets.BDay(max(self.horizons) + 5)
+            prices = EventStudy.download_prices(download_tickers, events['transaction_date'].min(),
+                                                events['transaction_date'].max() + max_horizon)
+            self.prices = prices
+        prices = prices.sort_index()
+
+        # price matrix: one row per trading date, one column per ticker
+        price_matrix = prices.to_numpy(dtype=float)
+        dates = pd.to_datetime(prices.index).values
+        n_dates = len(dates)
+
+        if self.benchmark is not None:
+            benchmark = prices[self.benchmark].to_numpy(dtype=float)
+        else:
+            # equal-weighted index built from the mean daily return of all the tickers
+            with np.errstate(invalid='ignore', divide='ignore'):
+                daily_returns = price_matrix[1:] / price_matrix[:-1] - 1
+            valid_returns = np.isfinite(daily_returns)
+            mean_returns = np.where(valid_returns, daily_returns, 0).sum(axis=1) / \
+                np.maximum(valid_returns.sum(axis=1), 1)
+            benchmark = np.concatenate([[1.0], np.cumprod(1 + mean_returns)])
+
+        # locate every event in the price matrix
+        col = pd.Index(prices.columns).get_indexer(tickers)
+        row = np.searchsorted(dates, events['transaction_date'].values, side='left')
+        located = (col >= 0) & (row < n_dates)
+        row = np.where(located, row, 0)
+        col = np.where(located, col, 0)
+        base_price = np.where(located, price_matrix[row, col], np.nan)
+        base_benchmark = np.where(located, benchmark[row], np.nan)
+
+        for horizon in self.horizons:
+            end_row = row + horizon
+            in_range = located & (end_row < n_dates)
+            end_row = np.where(in_range, end_row, 0)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                forward_return = np.where(
+                    in_range, price_matrix[end_row, col] / base_price - 1, np.nan)
+                benchmark_return = np.where(
+                    in_range, benchmark[end_row] / base_benchmark - 1, np.nan)
+            events[f'forward_return_{horizon}'] = forward_return
+            events[f'abnormal_return_{horizon}'] = forward_return - benchmark_return
+
+        events['role'] = np.select([events['isOfficer'].fillna(False).astype(bool).values,
+                                    events['isDirector'].fillna(False).astype(bool).values],
+                                   ['Officer', 'Director'], default='Other')
+        if 'shares_value_usd' in events.columns:
+            events['size_bucket'] = pd.cut(events['shares_value_usd'].abs(), bins=EventStudy.size_bins,
+                                           labels=EventStudy.size_labels, include_lowest=True)
+        return events
+
+    def summarize(self, results: pd.DataFrame, by: List[str] = None) -> pd.DataFrame:
+        """
+        Aggregates the returns of the events by group.
+
+        Parameters:
+        results (DataFrame): The output of compute.
+        by (List[str], optional): Columns to group by, e.g. 'code', 'role', 'size_bucket'. Defaults to None, which groups by 'code'.
+
+        Returns:
+        DataFrame: The number of events and the mean and median returns of each group.
+        """
+        if by is None:
+            by = ['code']
+        return_columns = [f'{kind}_return_{horizon}' for horizon in self.horizons
+                          for kind in ('forward', 'abnormal')]
+        return results.groupby(by, observed=True)[return_columns].agg(['count', 'mean', 'median'])
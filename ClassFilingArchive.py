@@ -0,0 +1,260 @@
+import os
+import re
+import time
+import uuid
+import shutil
+import sqlite3
+import hashlib
+import threading
+import zstandard
+import pyarrow as pa
+import pyarrow.parquet as pq
+from typing import List
+from concurrent.futures import ProcessPoolExecutor
+from ClassForm4 import Form4
+
+
+class FilingArchive:
+    # a new shard file is started once the current one reaches this size
+    max_shard_bytes = 1024 ** 3
+    # CIK listings change with every filing, only the documents of a filing are kept
+    archived_kinds = ('form4', 'index')
+
+    def __init__(self, path: str = 'system/raw-archive', compression_level: int = 10) -> None:
+        """
+        Initializes a new instance of the FilingArchive class, a local archive of the raw SEC documents.
+        Documents are stored once per content hash, zstd compressed and packed into shard files,
+        with a SQLite index from URL and accession to the compressed blob.
+
+        Parameters:
+        path (str, optional): The directory of the archive. Defaults to 'system/raw-archive'.
+        compression_level (int, optional): The zstd compression level. Defaults to 10.
+        """
+        self.path = path
+        self.pid = os.getpid()
+        os.makedirs(path, exist_ok=True)
+        self.compressor = zstandard.ZstdCompressor(level=compression_level)
+        self.decompressor = zstandard.ZstdDecompressor()
+        # a single connection shared by the threads of the process
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(os.path.join(path, 'index.sqlite'), timeout=60,
+                                          isolation_level=None, check_same_thread=False)
+        self.connection.execute('''
+            CREATE TABLE IF NOT EXISTS blobs (
+                sha256 TEXT PRIMARY KEY,
+                shard INTEGER NOT NULL,
+                offset INTEGER NOT NULL,
+                length INTEGER NOT NULL,
+                size INTEGER NOT NULL
+            )''')
+        self.connection.execute('''
+            CREATE TABLE IF NOT EXISTS documents (
+                url TEXT PRIMARY KEY,
+                sha256 TEXT NOT NULL,
+                cik TEXT,
+                accession TEXT,
+                kind TEXT,
+                fetched_at REAL
+            )''')
+        self.connection.execute(
+            'CREATE INDEX IF NOT EXISTS documents_accession ON documents (accession)')
+        self.connection.execute(
+            'CREATE INDEX IF NOT EXISTS documents_kind_cik ON documents (kind, cik)')
+
+    def shard_file(self, shard: int) -> str:
+        return os.path.join(self.path, f'shard-{shard:05d}.pack')
+
+    @ staticmethod
+    def describe(url: str) -> tuple:
+        """
+        Finds the CIK, accession and kind ('listing', 'index' or 'form4') of an EDGAR archive URL.
+
+        Parameters:
+        url (str): The URL.
+
+        Returns:
+        tuple: The CIK, the accession (None for CIK listings) and the kind.
+        """
+        match = re.search(r'/Archives/edgar/data/(\d+)/?(\d{18})?', url)
+        cik = match.group(1).lstrip('0') if match else None
+        accession = match.group(2) if match else None
+        if url.endswith('.xml'):
+            kind = 'form4'
+        elif accession is not None:
+            kind = 'index'
+        else:
+            kind = 'listing'
+        return cik, accession, kind
+
+    def put(self, url: str, content: bytes) -> str:
+        """
+        Stores a fetched document of one of the archived_kinds. Content already in the archive is not written again.
+
+        Parameters:
+        url (str): The URL the document was fetched from.
+        content (bytes): The raw document.
+
+        Returns:
+        str: The SHA-256 of the content, or None if the document is not of an archived kind.
+        """
+        cik, accession, kind = FilingArchive.describe(url)
+        if kind not in FilingArchive.archived_kinds:
+            return None
+        sha256 = hashlib.sha256(content).hexdigest()
+        with self.lock:
+            # the write transaction also serializes appends to the shard files between processes
+            self.connection.execute('BEGIN IMMEDIATE')
+            try:
+                exists = self.connection.execute(
+                    'SELECT 1 FROM blobs WHERE sha256 = ?', (sha256,)).fetchone()
+                if exists is None:
+                    shard = self.connection.execute(
+                        'SELECT MAX(shard) FROM blobs').fetchone()[0] or 0
+                    if os.path.exists(self.shard_file(shard)) and \
+                            os.path.getsize(self.shard_file(shard)) >= FilingArchive.max_shard_bytes:
+                        shard += 1
+                    compressed = self.compressor.compress(content)
+                    with open(self.shard_file(shard), 'ab') as shard_file:
+                        shard_file.seek(0, os.SEEK_END)
+                        offset = shard_file.tell()
+                        shard_file.write(compressed)
+                    self.connection.execute('INSERT INTO blobs (sha256, shard, offset, length, size) VALUES (?, ?, ?, ?, ?)',
+                                            (sha256, shard, offset, len(compressed), len(content)))
+                self.connection.execute('INSERT OR REPLACE INTO documents (url, sha256, cik, accession, kind, fetched_at) VALUES (?, ?, ?, ?, ?, ?)',
+                                        (url, sha256, cik, accession, kind, time.time()))
+                self.connection.execute('COMMIT')
+            except Exception:
+                self.connection.execute('ROLLBACK')
+                raise
+        return sha256
+
+    def get(self, sha256: str) -> bytes:
+        """
+        Reads a document by the SHA-256 of its content.
+
+        Parameters:
+        sha256 (str): The SHA-256 of the content.
+
+        Returns:
+        bytes: The raw document, or None if it is not archived.
+        """
+        with self.lock:
+            row = self.connection.execute(
+                'SELECT shard, offset, length FROM blobs WHERE sha256 = ?', (sha256,)).fetchone()
+        if row is None:
+            return None
+        with open(self.shard_file(row[0]), 'rb') as shard_file:
+            shard_file.seek(row[1])
+            return self.decompressor.decompress(shard_file.read(row[2]))
+
+    def get_url(self, url: str) -> bytes:
+        """
+        Reads the last archived version of a URL.
+
+        Parameters:
+        url (str): The URL.
+
+        Returns:
+        bytes: The raw document, or None if it is not archived.
+        """
+        with self.lock:
+            row = self.connection.execute(
+                'SELECT sha256 FROM documents WHERE url = ?', (url,)).fetchone()
+        return self.get(row[0]) if row is not None else None
+
+    def archived_ciks(self) -> List[str]:
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT DISTINCT cik FROM documents WHERE kind = 'form4' ORDER BY cik").fetchall()
+        return [row[0] for row in rows]
+
+    @ staticmethod
+    def keep_unarchived(backup_path: str, partition_path: str, accessions: set) -> int:
+        """
+        Copies the rows of a lake partition whose filing is not archived back into the partition,
+        so a reparse only replaces the rows of the archived filings.
+
+        Parameters:
+        backup_path (str): The partition moved aside, in the compact lake schema.
+        partition_path (str): The partition being rebuilt.
+        accessions (set): The archived accessions, as integers.
+
+        Returns:
+        int: The number of rows kept.
+        """
+        schema = Form4.pa_schema.remove(
+            Form4.pa_schema.get_field_index('parent_cik'))
+        table = pq.read_table(backup_path, schema=schema)
+        kept = table.to_pandas()
+        kept = kept[~kept['accession'].isin(accessions)]
+        if len(kept) > 0:
+            os.makedirs(partition_path, exist_ok=True)
+            pq.write_table(pa.Table.from_pandas(kept, schema=schema, preserve_index=False),
+                           os.path.join(partition_path, uuid.uuid4().hex + '-0.parquet'))
+        print(f"Kept {len(kept)} rows of filings that are not archived.")
+        return len(kept)
+
+    def reparse(self, ciks: List[str] = None, system_path: str = 'system', rebuild: bool = True, parse_workers: int = None) -> None:
+        """
+        Parses the archived Form 4 documents again and syncs them to the Form 4 lake, without any request to SEC.gov.
+
+        Parameters:
+        ciks (List[str], optional): Parent CIKs to reparse. Defaults to None, which reparses every archived CIK.
+        system_path (str, optional): The root directory the data is written to. Defaults to 'system'.
+        rebuild (bool, optional): Whether to replace the rows of the archived filings in the lake partition of each CIK with the new parse.
+            The rows of filings that are not archived, e.g. scraped before the archive existed, are kept. When False, only the archived
+            filings missing from the lake are added. Defaults to True.
+        parse_workers (int, optional): Number of parsing processes. Defaults to None, which uses all the cores.
+        """
+        ciks = [cik.lstrip('0') for cik in ciks] if ciks is not None else self.archived_ciks()
+        with ProcessPoolExecutor(max_workers=parse_workers) as pool:
+            for cik in ciks:
+                with self.lock:
+                    rows = self.connection.execute(
+                        "SELECT url, accession, sha256 FROM documents WHERE kind = 'form4' AND cik = ? ORDER BY url", (cik,)).fetchall()
+                form4 = Form4(cik, system_path=system_path, run=False)
+                if not rebuild:
+                    # a filing already in the lake would be synced again under new hashes if its parse changed
+                    form4.get_records_operation_ids()
+                    recorded = set(form4.records_operation_ids)
+                    rows = [row for row in rows if row[1] not in recorded]
+                if len(rows) == 0:
+                    print(f"CIK: '{cik}'| No archived Form 4 documents to reparse.")
+                    continue
+
+                # the operation IDs scraped before are already recorded
+                form4.get_scraped_operation_ids()
+                form4.operation_ids = set(row[1] for row in rows) - set(form4.scraped_operation_ids)
+                urls = [row[0] for row in rows]
+                contents = [self.get(row[2]) for row in rows]
+                for records in pool.map(Form4.parse_form4, contents, urls, [cik] * len(rows), chunksize=16):
+                    form4.data.extend(records)
+                print(
+                    f"CIK: '{cik}'| Reparsed {len(rows)} archived documents into {len(form4.data)} rows.")
+
+                # move the current partition aside, so it can be restored if the sync fails
+                partition_path = os.path.join(
+                    form4.parquet_path, 'parent_cik=' + cik)
+                backup_path = os.path.join(
+                    system_path, 'form4', 'reparse-backup', 'parent_cik=' + cik)
+                moved = rebuild and os.path.isdir(partition_path)
+                if moved:
+                    Form4.migrate_partition(form4.parquet_path, cik)
+                    shutil.rmtree(backup_path, ignore_errors=True)
+                    os.makedirs(os.path.dirname(backup_path), exist_ok=True)
+                    shutil.move(partition_path, backup_path)
+                try:
+                    if moved:
+                        FilingArchive.keep_unarchived(backup_path, partition_path,
+                                                      set(int(row[1]) for row in rows))
+                    form4.sync_system_data()
+                    if rebuild:
+                        form4.ownership_ledger.rebuild(cik)
+                        form4.insider_graph.update([cik])
+                    if moved:
+                        shutil.rmtree(backup_path, ignore_errors=True)
+                except:
+                    print(f"Unable to permorm Data Sync for {cik}")
+                    if os.path.isdir(backup_path):
+                        shutil.rmtree(partition_path, ignore_errors=True)
+                        shutil.move(backup_path, partition_path)
@@ -4,12 +4,13 @@ import datetime
 import statistics
 import requests
 import pandas as pd
-import yfinance as yf
-import plotly.graph_objects as go
 from typing import List
 from bs4 import BeautifulSoup
 import hashlib
+import threading
 import pyarrow as pa
+import pyarrow.parquet as pq
+# the ownership ledger and the insider graph are imported by their accessors, so workers preloading ClassForm4 don't load them
 
 
 class Form4:
@@ -17,8 +18,53 @@ class Form4:
     delay = 0
     # list to store response times
     response_times = []
-
-    def __init__(self, cik: str, start_date: str = None, end_date: str = None, days_range: int = 0) -> None:
+    # maximum SEC requests per second of this process, None for no limit
+    max_requests_per_second = None
+    last_request_time = 0
+    request_lock = threading.Lock()
+    # directory of the raw document archive, None to disable archiving
+    archive_path = 'system/raw-archive'
+    archive = None
+    # root of the shared system data
+    system_path = 'system'
+    base_url = "https://www.sec.gov"
+    base_path = "/Archives/edgar/data/"
+    # repetitive text columns, dictionary encoded in the lake and categorical in memory
+    category_columns = ['name', 'ticker', 'rptOwnerName', 'officerTitle', 'security_title', 'code',
+                        'acquired_disposed_code', 'direct_or_indirect_ownership', 'form4_filename']
+    # columns identifying a transaction across partitions. A filing is stored under both the issuer and the reporting
+    # owner when both are scraped, and the copies have different hashes since 'parent_cik' is part of the hash
+    transaction_key_columns = ['accession', 'form4_filename', 'cik', 'rptOwnerCik', 'security_title', 'transaction_date',
+                               'code', 'shares', 'acquired_disposed_code', 'shares_owned_following_transaction',
+                               'direct_or_indirect_ownership']
+    # schema of the Form 4 lake ('form4_link' is stored as 'accession' + 'form4_filename')
+    pa_schema = pa.schema([
+        pa.field('cik', pa.int64()),
+        pa.field('parent_cik', pa.int64()),
+        pa.field('name', pa.dictionary(pa.int32(), pa.string())),
+        pa.field('ticker', pa.dictionary(pa.int32(), pa.string())),
+        pa.field('rptOwnerName', pa.dictionary(pa.int32(), pa.string())),
+        pa.field('rptOwnerCik', pa.int64()),
+        pa.field('isDirector', pa.bool_()),
+        pa.field('isOfficer', pa.bool_()),
+        pa.field('isTenPercentOwner', pa.bool_()),
+        pa.field('isOther', pa.bool_()),
+        pa.field('officerTitle', pa.dictionary(pa.int32(), pa.string())),
+        pa.field('security_title', pa.dictionary(pa.int32(), pa.string())),
+        pa.field('transaction_date', pa.date32()),
+        pa.field('form_type', pa.int8()),
+        pa.field('code', pa.dictionary(pa.int32(), pa.string())),
+        pa.field('equity_swap', pa.float64()),
+        pa.field('shares', pa.float64()),
+        pa.field('acquired_disposed_code', pa.dictionary(pa.int32(), pa.string())),
+        pa.field('shares_owned_following_transaction', pa.float64()),
+        pa.field('direct_or_indirect_ownership', pa.dictionary(pa.int32(), pa.string())),
+        pa.field('accession', pa.int64()),
+        pa.field('form4_filename', pa.dictionary(pa.int32(), pa.string())),
+        pa.field('hash', pa.string()),
+    ])
+
+    def __init__(self, cik: str, start_date: str = None, end_date: str = None, days_range: int = 0, operation_ids: List[str] = None, system_path: str = 'system', run: bool = True, shared_system_path: str = None) -> None:
         """
         Initializes a new instance of the Form4 class.
 
@@ -26,19 +72,32 @@ class Form4:
         cik (str): The CIK number to search for.
         start_date (str, optional): The start date to filter the search results by. Must be in YYYY-MM-DD format. Defaults to None.
         end_date (str, optional): The end date to filter the search results by. Must be in YYYY-MM-DD format. Defaults to None.
+        operation_ids (List[str], optional): Accession numbers (with or without dashes) to scrape. When given, the CIK archive listing is not downloaded. Defaults to None.
+        system_path (str, optional): The root directory the data is written to. Defaults to 'system'.
+        run (bool, optional): Whether to find, scrape and sync the operations right away. When False, the caller drives those steps. Defaults to True.
+        shared_system_path (str, optional): The shared system data whose scraped operation IDs are skipped as well, e.g. the merged store of the nodes. Defaults to None, which uses Form4.system_path.
         """
         base_url = "https://www.sec.gov"
         base_path = "/Archives/edgar/data/"
-        self.parquet_path = 'system/form4/data'
+        self.parquet_path = system_path + '/form4/data'
         self.base_url = base_url
         self.base_path = base_path
         self.cik = cik.lstrip('0')
         self.operation_ids = set()
         self.form4_links = set()
         self.data = []
-        self.scraped_operation_ids_path = 'system/form4/scraped_operation_ids'
+        self.frame = None
+        self.scraped_operation_ids_path = system_path + '/form4/scraped_operation_ids'
+        # operation IDs scraped into the shared system data are skipped as well
+        if shared_system_path is None:
+            shared_system_path = Form4.system_path
+        self.shared_scraped_operation_ids_path = shared_system_path + \
+            '/form4/scraped_operation_ids'
         self.scraped_operation_ids = []
         self.records_operation_ids = []
+        self.local_system_path = system_path
+        self._ownership_ledger = None
+        self._insider_graph = None
 
         self.start_date, self.end_date = Form4.calculate_dates(
             start_date, end_date, days_range)
@@ -50,15 +109,108 @@ class Form4:
             "X-Requested-With": "XMLHttpRequest",
             "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/80.0.3987.163 Safari/537.36"
         }
-        self.get_operation_ids()
-        self.scrape_form4()
+        if operation_ids is not None:
+            self.set_operation_ids(operation_ids)
+        elif run:
+            self.get_operation_ids()
+        if run:
+            self.scrape_form4()
+
+    @property
+    def frame(self) -> pd.DataFrame:
+        """
+        The synced Form 4 data of the date range as a compact DataFrame. After a sync it is read from the lake
+        on first access, so syncing only reads the hashes of the partition.
+        """
+        if self._frame is None and self._frame_synced:
+            self._frame = self.read_system_data()
+        return self._frame
+
+    @frame.setter
+    def frame(self, frame: pd.DataFrame) -> None:
+        self._frame = frame
+        self._frame_synced = False
+
+    @property
+    def data(self) -> List[dict]:
+        """
+        The Form 4 data as a list of dictionaries. Once synced, it is materialized from the compact `frame` DataFrame
+        on first access and kept, so rows appended to it are synced by the next sync_system_data.
+        Prefer `frame` to work on the synced data.
+        """
+        if self._data is None:
+            self._data = Form4.expand_frame(self.frame).to_dict(
+                orient='records') if self.frame is not None else []
+        return self._data
+
+    @data.setter
+    def data(self, data: List[dict]) -> None:
+        self._data = data
+        self.frame = None
+
+    @property
+    def ownership_ledger(self):
+        """
+        The OwnershipLedger of the system data, created on first access.
+        """
+        if self._ownership_ledger is None:
+            from ClassOwnershipLedger import OwnershipLedger
+            self._ownership_ledger = OwnershipLedger(self.local_system_path)
+        return self._ownership_ledger
+
+    @property
+    def insider_graph(self):
+        """
+        The InsiderGraph of the system data, created on first access.
+        """
+        if self._insider_graph is None:
+            from ClassInsiderGraph import InsiderGraph
+            self._insider_graph = InsiderGraph(self.local_system_path)
+        return self._insider_graph
+
+    def fetch(self, url: str) -> requests.Response:
+        """
+        Sends a GET request to SEC.gov, waiting as needed to stay within max_requests_per_second, and archives the response.
+
+        Parameters:
+        url (str): The URL to request.
+
+        Returns:
+        Response: The response of the request.
+        """
+        if Form4.max_requests_per_second:
+            with Form4.request_lock:
+                wait = Form4.last_request_time + 1 / \
+                    Form4.max_requests_per_second - time.time()
+                if wait > 0:
+                    time.sleep(wait)
+                Form4.last_request_time = time.time()
+        response = requests.get(url, headers=self.headers)
+
+        # keep the raw document so it can be parsed again without SEC.gov
+        archive = Form4.get_archive()
+        if archive is not None and response.ok and b'Request Rate Threshold Exceeded' not in response.content:
+            archive.put(url, response.content)
+        return response
+
+    @ staticmethod
+    def get_archive():
+        """
+        Returns the raw document archive of the current process, or None if archiving is disabled.
+        """
+        if Form4.archive_path is None:
+            return None
+        if Form4.archive is None or Form4.archive.pid != os.getpid():
+            from ClassFilingArchive import FilingArchive
+            Form4.archive = FilingArchive(Form4.archive_path)
+        return Form4.archive
 
     def get_operation_ids(self) -> None:
         """
         Gets the operation IDs for the search results and saves them to the Form4 instance.
         """
         url = self.base_url + self.base_path + self.cik + '/'
-        response1 = requests.get(url, headers=self.headers)
+        response1 = self.fetch(url)
         soup1 = BeautifulSoup(response1.text, "html.parser")
         title = soup1.find('title').text.strip()
         id_try = True
@@ -100,6 +252,19 @@ class Form4:
         print(
             f"CIK: '{self.cik}'| Found {len(self.operation_ids)} new operations.")
 
+    def set_operation_ids(self, operation_ids: List[str]) -> None:
+        """
+        Sets the operation IDs from a known list of accession numbers instead of the CIK archive listing.
+
+        Parameters:
+        operation_ids (List[str]): Accession numbers, with or without dashes.
+        """
+        self.operation_ids = set(op_id.replace('-', '')
+                                 for op_id in operation_ids)
+        self.filter_operation_ids()
+        print(
+            f"CIK: '{self.cik}'| Found {len(self.operation_ids)} new operations.")
+
     def filter_operation_ids(self):
         # Read the Parquet files partitioned by 'cik'
         self.get_scraped_operation_ids()
@@ -109,6 +274,8 @@ class Form4:
                 x for x in self.operation_ids if x not in self.scraped_operation_ids]
 
     def save_scraped_operation_ids(self):
+        if len(self.operation_ids) == 0:
+            return
         # Create a DataFrame with ids and current date
         df = pd.DataFrame({'date': datetime.date.today(),
                            'cik': self.cik, 'operation_id': list(self.operation_ids)})
@@ -125,37 +292,38 @@ class Form4:
                       partition_cols=['cik'], schema=schema)
 
     def get_scraped_operation_ids(self):
-        if os.path.exists(self.scraped_operation_ids_path):
-            # Define the schema with data types for each column
-            schema = pa.schema([
-                ('date', pa.date32()),
-                ('cik', pa.string()),
-                ('operation_id', pa.string())
-            ])
-
-            # Read the Parquet files partitioned by 'cik'
-            df = pd.read_parquet(
-                self.scraped_operation_ids_path,
-                columns=['operation_id'],
-                filters=[('cik', '=', self.cik)],
-                schema=schema
-            )
-
-            # Convert operation_id column to a one-dimensional Python list
-            self.scraped_operation_ids = list(df['operation_id'])
+        scraped_operation_ids = []
+        for path in sorted(set([self.scraped_operation_ids_path, self.shared_scraped_operation_ids_path])):
+            if os.path.exists(path):
+                # Define the schema with data types for each column
+                schema = pa.schema([
+                    ('date', pa.date32()),
+                    ('cik', pa.string()),
+                    ('operation_id', pa.string())
+                ])
+
+                # Read the Parquet files partitioned by 'cik'
+                df = pd.read_parquet(
+                    path,
+                    columns=['operation_id'],
+                    filters=[('cik', '=', self.cik)],
+                    schema=schema
+                )
+                scraped_operation_ids.extend(df['operation_id'])
+
+        # Convert operation_id column to a one-dimensional Python list
+        self.scraped_operation_ids = scraped_operation_ids
 
     def get_records_operation_ids(self):
         if os.path.exists(self.parquet_path):
-            # Read the Parquet files into a pandas DataFrame
-            df = pd.read_parquet(self.parquet_path, filters=[
-                                 ('parent_cik', '=', self.cik)])
-            # Read the form4_link column from the DataFrame
-            form4_links_col = df['form4_link']
+            Form4.migrate_partition(self.parquet_path, self.cik)
+            # Read the accession column of the Parquet files into a pandas DataFrame
+            df = pd.read_parquet(self.parquet_path, columns=['accession'], schema=Form4.pa_schema, filters=[
+                                 ('parent_cik', '=', int(self.cik))])
 
-            # Generate a list with the operation_ids, extracted from the form4_links_col
-            records_operation_ids = []
-            for form4_link in form4_links_col:
-                records_operation_ids.append(form4_link.split("/")[-2])
+            # Generate a list with the operation_ids, formatted from the accession column
+            records_operation_ids = [
+                str(accession).zfill(18) for accession in df['accession']]
 
             # Convert the list to a set to remove duplicates, then convert back to a list and sort
             records_operation_ids = list(set(records_operation_ids))
@@ -167,6 +335,17 @@ class Form4:
         """
         Scrapes the Form 4 data for each operation ID and saves it to the Form4 instance.
         """
+        for form4_link in self.iter_form4_links():
+            self.get_form4_data(form4_link)
+        try:
+            self.sync_system_data()
+        except:
+            print(f"Unable to permorm Data Sync for {self.cik}")
+
+    def iter_form4_links(self):
+        """
+        Follows the index pages of each operation ID and yields the links to its Form 4 XML documents.
+        """
         delay = 0
         response_times = [0]
         progress_base = len(self.operation_ids)
@@ -180,7 +359,7 @@ class Form4:
             while id_try == True:
                 url = self.base_url + self.base_path + self.cik + '/' + operation_id
                 # get the index page for the filing
-                response2 = requests.get(url, headers=self.headers)
+                response2 = self.fetch(url)
                 soup2 = BeautifulSoup(response2.text, "html.parser")
                 title = soup2.find('title').text.strip()
 
@@ -205,8 +384,7 @@ class Form4:
                     break
 
                 # get the primary document page
-                response3 = requests.get(
-                    self.base_url + index_link, headers=self.headers)
+                response3 = self.fetch(self.base_url + index_link)
                 soup3 = BeautifulSoup(response3.text, "html.parser")
 
                 # find the link to the FORM 4 document
@@ -224,8 +402,8 @@ class Form4:
                                         '/' + operation_id + '/' + \
                                         a["href"].split("/")[-1]
                                     if form4_link not in form4_links:
-                                        self.get_form4_data(form4_link)
                                         form4_links.append(form4_link)
+                                        yield form4_link
                                     break
                 end_time = time.time()
 
@@ -248,23 +426,33 @@ class Form4:
                         f"CIK: '{self.cik}'| Decrease delay by 1 to {delay} seconds.")
 
                 time.sleep(delay)
-        try:
-            self.sync_system_data()
-        except:
-            print(f"Unable to permorm Data Sync for {self.cik}")
 
-    def get_form4_data(self, form4_link: str) -> List[dict]:
+    def get_form4_data(self, form4_link: str) -> None:
+        """
+        Downloads and parses a Form 4 filing and adds its transactions to the Form4 instance.
+
+        Parameters:
+        form4_link (str): The URL to the Form 4 filing.
+        """
+        response4 = self.fetch(form4_link)
+        self.data.extend(Form4.parse_form4(
+            response4.content, form4_link, self.cik))
+
+    @ staticmethod
+    def parse_form4(xml, form4_link: str, parent_cik: str) -> List[dict]:
         """
         Parses the Form 4 data and returns it as a list of dictionaries.
 
         Parameters:
+        xml (str or bytes): The Form 4 XML document.
         form4_link (str): The URL to the Form 4 filing.
+        parent_cik (str): The CIK the filing was found under.
 
         Returns:
         List[dict]: A list of dictionaries containing the Form 4 data.
         """
-        response4 = requests.get(form4_link, headers=self.headers)
-        soup4 = BeautifulSoup(response4.text, "lxml-xml")
+        soup4 = BeautifulSoup(xml, "lxml-xml")
+        data = []
 
         cik_file_tag = soup4.find("issuerCik")
         cik_file = cik_file_tag.text if cik_file_tag else ""
@@ -347,9 +535,9 @@ class Form4:
                 "value") if direct_or_indirect_ownership_tag else ""
             direct_or_indirect_ownership = direct_or_indirect_ownership_tag.text if direct_or_indirect_ownership_tag else ""
 
-            self.data.append({
+            data.append({
                 "cik": cik_file.lstrip('0'),
-                "parent_cik": self.cik,
+                "parent_cik": parent_cik,
                 "name": name,
                 "ticker": ticker,
                 "rptOwnerName": rptOwnerName,
@@ -370,9 +558,14 @@ class Form4:
                 "direct_or_indirect_ownership": direct_or_indirect_ownership,
                 "form4_link": form4_link
             })
+        return data
 
     def sync_system_data(self):
-        df = pd.DataFrame(self.data)
+        # Rows waiting to be synced, without materializing the synced frame
+        df = pd.DataFrame(self._data if self._data is not None else [])
+        if 'hash' in df.columns:
+            # Rows materialized from the synced frame are already in the lake
+            df = df[df['hash'].isna()].drop(columns=['hash'])
         # Define a dictionary with the data types for each column
         schema = {
             'cik': 'int',
@@ -405,74 +598,65 @@ class Form4:
                 df[col] = df[col].astype(dtype)
 
         # Call the generate_hash method on the class itself, not on an instance of the class
+        # The hash is computed over the string columns above, so it does not change with the compact lake schema
         df = Form4.generate_hash(df)
         # Select only the unique rows based on the 'hash' column
         df = df.drop_duplicates(subset=['hash'])
 
         print(f"Incoming df: {len(df)}")
+        partition_path = os.path.join(self.parquet_path, 'parent_cik=' + self.cik)
         # Check if the Parquet file already exists
-        if os.path.isdir(self.parquet_path):
-            pa_schema = pa.schema([
-                pa.field('cik', pa.int64()),
-                pa.field('parent_cik', pa.int64()),
-                pa.field('name', pa.string()),
-                pa.field('ticker', pa.string()),
-                pa.field('rptOwnerName', pa.string()),
-                pa.field('rptOwnerCik', pa.string()),
-                pa.field('isDirector', pa.bool_()),
-                pa.field('isOfficer', pa.bool_()),
-                pa.field('isTenPercentOwner', pa.bool_()),
-                pa.field('isOther', pa.bool_()),
-                pa.field('officerTitle', pa.string()),
-                pa.field('security_title', pa.string()),
-                pa.field('transaction_date', pa.string()),
-                pa.field('form_type', pa.int64()),
-                pa.field('code', pa.string()),
-                pa.field('equity_swap', pa.float64()),
-                pa.field('shares', pa.float64()),
-                pa.field('acquired_disposed_code', pa.string()),
-                pa.field('shares_owned_following_transaction', pa.float64()),
-                pa.field('direct_or_indirect_ownership', pa.string()),
-                pa.field('form4_link', pa.string()),
-                pa.field('hash', pa.string()),
-            ])
-
-            # Read the existing data from the Parquet file
-            existing_df = pd.read_parquet(
-                path=self.parquet_path, engine='pyarrow', schema=pa_schema, filters=[('parent_cik', '=', int(self.cik))])
-
-            # Convert the 'transaction_date' column to a datetime format
-            existing_df['transaction_date'] = pd.to_datetime(
-                existing_df['transaction_date'], format='%Y-%m-%d')
-
-            # Filter the DataFrame to keep only rows within the specified date range
-            mask = (existing_df['transaction_date'] >= self.start_date) & (
-                existing_df['transaction_date'] <= self.end_date)
-            existing_df = existing_df.loc[mask]
-            print(f"Existing df: {len(existing_df)}")
+        if os.path.isdir(partition_path):
+            # Bring the partition to the compact schema if it was written by an older version
+            Form4.migrate_partition(self.parquet_path, self.cik)
+
+            # Only the hashes of the existing data are needed to find the new rows
+            existing_hashes = pd.read_parquet(
+                path=self.parquet_path, engine='pyarrow', schema=Form4.pa_schema, columns=['hash'],
+                filters=[('parent_cik', '=', int(self.cik))])['hash']
+            print(f"Existing df: {len(existing_hashes)}")
+            df = df[~df['hash'].isin(existing_hashes)].dropna()
         else:
-            a = 0
             print(f"No Existing df")
 
+        print(f"New df: {len(df)}")
+        df = Form4.compact_frame(df)
         if len(df) > 0:
-            # Write the DataFrame to a directory-based Parquet file
-            if ('existing_df' in locals()):
-                # Reorder the columns of the previous DataFrame to match the current DataFrame
-                existing_df = existing_df[df.columns]
-                df = df[~df['hash'].isin(existing_df['hash'])].dropna()
-            print(f"New df: {len(df)}")
-            if len(df) > 0:
-                # Remove the original index column from the DataFrame
-                df = df.reset_index(drop=True)
-                df.to_parquet(self.parquet_path, partition_cols=[
-                    'parent_cik'], engine='pyarrow')
-
-        if ('existing_df' in locals()):
-            # Concatenate the current DataFrame with the filtered previous DataFrame
-            df = pd.concat([df, existing_df], ignore_index=True)
+            # Remove the original index column from the DataFrame
+            df = df.reset_index(drop=True)
+            Form4.to_lake_frame(df).to_parquet(self.parquet_path, partition_cols=[
+                'parent_cik'], engine='pyarrow')
+            # Keep the post-transaction balances of the CIK up to date
+            self.ownership_ledger.update(self.cik, df)
+            # Index the owners of the new files
+            self.insider_graph.update([self.cik])
+
         self.save_scraped_operation_ids()
-        # Convert the resulting DataFrame to a list of dictionaries
-        self.data = df.to_dict(orient='records')
+        if os.path.isdir(partition_path):
+            # The synced data of the date range is read from the lake on first access of frame
+            self.frame = None
+            self._frame_synced = True
+        else:
+            self.frame = df.reset_index(drop=True)
+        self._data = None
+
+    def read_system_data(self) -> pd.DataFrame:
+        """
+        Reads the synced data of the CIK within the date range from the Form 4 lake.
+
+        Returns:
+        DataFrame: The compact Form 4 rows.
+        """
+        df = pd.read_parquet(
+            path=self.parquet_path, engine='pyarrow', schema=Form4.pa_schema, filters=[('parent_cik', '=', int(self.cik))])
+        df = Form4.compact_frame(df)
+
+        # Filter the DataFrame to keep only rows within the specified date range
+        if self.start_date is not None and self.end_date is not None:
+            mask = (df['transaction_date'] >= self.start_date) & (
+                df['transaction_date'] <= self.end_date)
+            df = df.loc[mask]
+        return df.reset_index(drop=True)
 
     def save_to_csv(self, path: str = 'data/saved_form4_date.csv') -> None:
         """
@@ -481,7 +665,8 @@ class Form4:
         Parameters:
         path (str): The path and filename to save the CSV file to.
         """
-        if (len(self.data) > 0):
+        form4_df = Form4.expand_frame(self.frame) if self.frame is not None else pd.DataFrame(self.data)
+        if (len(form4_df) > 0):
             directory_index = path.rfind("/")
             if directory_index != -1:
                 directory = path[:directory_index]
@@ -489,7 +674,6 @@ class Form4:
                 if not os.path.exists(directory):
                     os.makedirs(directory)
 
-            form4_df = pd.DataFrame(self.data)
             form4_df.to_csv(path, sep='|', index=False)
             print(f"CIK: '{self.cik}'| Saved Form 4 data.")
         else:
@@ -510,6 +694,177 @@ class Form4:
 
         return pd_df
 
+    @ staticmethod
+    def drop_duplicate_filings(pd_df, prefer=None):
+        """
+        Keeps one copy of each transaction of compact Form 4 rows read across several parent CIKs.
+
+        Parameters:
+        pd_df (DataFrame): Compact Form 4 rows with the transaction_key_columns.
+        prefer (Series, optional): Boolean mask of the rows to keep over their copies, such as the priced ones. Defaults to None, which keeps the first copy.
+
+        Returns:
+        DataFrame: The rows, without the copies filed under another parent CIK.
+        """
+        if prefer is None:
+            return pd_df.drop_duplicates(subset=Form4.transaction_key_columns)
+        prefer = pd.Series(prefer, index=pd_df.index).fillna(False).astype(bool)
+        kept = pd.concat([pd_df[prefer], pd_df[~prefer]]).drop_duplicates(subset=Form4.transaction_key_columns)
+        return pd_df[pd_df.index.isin(kept.index)]
+
+    @ staticmethod
+    def compact_frame(pd_df):
+        """
+        Converts Form 4 rows to the compact in-memory representation: datetime dates, integer CIKs and accessions,
+        'form4_link' split into 'accession' and 'form4_filename', and categoricals for the repetitive text columns.
+
+        Parameters:
+        pd_df (DataFrame): Form 4 rows, either with the original string columns or already compact.
+
+        Returns:
+        DataFrame: The compact DataFrame.
+        """
+        pd_df = pd_df.copy()
+        if 'form4_link' in pd_df.columns:
+            link_parts = pd_df['form4_link'].astype(str).str.split('/')
+            pd_df['accession'] = link_parts.str[-2].astype('int64')
+            pd_df['form4_filename'] = link_parts.str[-1]
+            pd_df = pd_df.drop(columns=['form4_link'])
+
+        if 'transaction_date' in pd_df.columns:
+            pd_df['transaction_date'] = pd.to_datetime(
+                pd_df['transaction_date'], errors='coerce')
+
+        for col in ['cik', 'parent_cik', 'accession']:
+            if col in pd_df.columns:
+                pd_df[col] = pd_df[col].astype('int64')
+
+        if 'rptOwnerCik' in pd_df.columns:
+            pd_df['rptOwnerCik'] = pd.to_numeric(
+                pd_df['rptOwnerCik'], errors='coerce').astype('Int64')
+
+        if 'form_type' in pd_df.columns:
+            pd_df['form_type'] = pd_df['form_type'].astype('int8')
+
+        for col in Form4.category_columns:
+            if col in pd_df.columns:
+                pd_df[col] = pd_df[col].astype('category')
+
+        return pd_df
+
+    @ staticmethod
+    def expand_frame(pd_df):
+        """
+        Rebuilds the 'form4_link' column of a compact DataFrame.
+
+        Parameters:
+        pd_df (DataFrame): Compact Form 4 rows.
+
+        Returns:
+        DataFrame: The rows with 'form4_link' instead of 'accession' and 'form4_filename'.
+        """
+        pd_df = pd_df.copy()
+        if 'accession' in pd_df.columns and 'form4_filename' in pd_df.columns:
+            pd_df['form4_link'] = Form4.base_url + Form4.base_path + pd_df['parent_cik'].astype(str) + '/' + \
+                pd_df['accession'].astype(str).str.zfill(18) + '/' + \
+                pd_df['form4_filename'].astype(str)
+            pd_df = pd_df.drop(columns=['accession', 'form4_filename'])
+        return pd_df
+
+    @ staticmethod
+    def to_lake_frame(pd_df):
+        """
+        Prepares a compact DataFrame to be written with the lake schema.
+
+        Parameters:
+        pd_df (DataFrame): Compact Form 4 rows.
+
+        Returns:
+        DataFrame: The rows with the columns in schema order and 'transaction_date' as dates.
+        """
+        pd_df = pd_df.copy()
+        pd_df['transaction_date'] = pd_df['transaction_date'].dt.date
+        return pd_df[[name for name in Form4.pa_schema.names if name in pd_df.columns]]
+
+    @ staticmethod
+    def migrate_partition(parquet_path: str, cik: str) -> None:
+        """
+        Rewrites the Parquet files of a 'parent_cik' partition written with string dates, string owner CIKs and
+        'form4_link' into the compact lake schema. Files already in the compact schema are left untouched.
+
+        Parameters:
+        parquet_path (str): The path of the Form 4 lake.
+        cik (str): The parent CIK of the partition.
+        """
+        partition_path = os.path.join(
+            parquet_path, 'parent_cik=' + str(cik).lstrip('0'))
+        if not os.path.isdir(partition_path):
+            return
+
+        for file_name in sorted(os.listdir(partition_path)):
+            file_path = os.path.join(partition_path, file_name)
+            if not file_name.endswith('.parquet') or 'accession' in pq.read_schema(file_path).names:
+                continue
+
+            df = pq.read_table(file_path).to_pandas()
+            df['parent_cik'] = int(str(cik).lstrip('0'))
+            df = Form4.to_lake_frame(Form4.compact_frame(df))
+            df = df.drop(columns=['parent_cik'])
+
+            # Write next to the original and swap, so an interrupted migration never loses a file
+            tmp_path = file_path + '.tmp'
+            pq.write_table(pa.Table.from_pandas(
+                df, preserve_index=False), tmp_path)
+            # Keep the modification time, the rows are the same and readers use it to find new data
+            stat = os.stat(file_path)
+            os.utime(tmp_path, (stat.st_atime, stat.st_mtime))
+            os.replace(tmp_path, file_path)
+            print(f"CIK: '{cik}'| Migrated {file_name} to the compact schema.")
+
+    @ staticmethod
+    def migrate_system_data(parquet_path: str = 'system/form4/data') -> None:
+        """
+        Migrates every partition of the Form 4 lake to the compact schema.
+
+        Parameters:
+        parquet_path (str): The path of the Form 4 lake.
+        """
+        if not os.path.isdir(parquet_path):
+            return
+        for partition in sorted(os.listdir(parquet_path)):
+            if partition.startswith('parent_cik='):
+                Form4.migrate_partition(
+                    parquet_path, partition.split('=')[1])
+
+    @ staticmethod
+    def check_system_data(parquet_path: str = 'system/form4/data', ciks: List[str] = None) -> None:
+        """
+        Raises an error when a partition of the Form 4 lake is still in the schema of older versions.
+        Readers call it instead of migrating, so they never rewrite files a writer may be syncing.
+
+        Parameters:
+        parquet_path (str): The path of the Form 4 lake.
+        ciks (List[str], optional): Parent CIKs to check. Defaults to None, which checks every partition.
+
+        Raises:
+        ValueError: If a file has no 'accession' column.
+        """
+        if not os.path.isdir(parquet_path):
+            return
+        if ciks is None:
+            partitions = [partition for partition in sorted(os.listdir(parquet_path)) if partition.startswith('parent_cik=')]
+        else:
+            partitions = ['parent_cik=' + str(cik).lstrip('0') for cik in ciks]
+        for partition in partitions:
+            partition_path = os.path.join(parquet_path, partition)
+            if not os.path.isdir(partition_path):
+                continue
+            for file_name in sorted(os.listdir(partition_path)):
+                file_path = os.path.join(partition_path, file_name)
+                if file_name.endswith('.parquet') and 'accession' not in pq.read_schema(file_path).names:
+                    raise ValueError(
+                        f"{file_path} is in the legacy Form 4 schema. Run migrate_system_data() from main.py first.")
+
     @ staticmethod
     def calculate_dates(start_date: str = None, end_date: str = None, days_range: int = 0):
         """
@@ -0,0 +1,256 @@
+import os
+import queue
+import threading
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as csv
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from typing import List
+from concurrent.futures import ThreadPoolExecutor
+from ClassForm4 import Form4
+
+
+class Form4Export:
+    # file extension of each export format
+    formats = {'csv': '.csv', 'parquet': '.parquet', 'arrow': '.arrow'}
+    # enrichment columns of the trading-data lake
+    trading_data_schema = pa.schema([
+        pa.field('hash', pa.string()),
+        pa.field('open', pa.float64()),
+        pa.field('high', pa.float64()),
+        pa.field('low', pa.float64()),
+        pa.field('close', pa.float64()),
+        pa.field('adj_close', pa.float64()),
+        pa.field('volume', pa.float64()),
+        pa.field('daily_return', pa.float64()),
+        pa.field('percent_change', pa.float64()),
+        pa.field('range', pa.float64()),
+        pa.field('average_price', pa.float64()),
+        pa.field('shares_value_usd', pa.float64()),
+    ])
+
+    def __init__(self, ciks: List[str] = None, start_date: str = None, end_date: str = None, tickers: List[str] = None,
+                 enrich: bool = False, batch_size: int = 65536, parquet_path: str = 'system/form4/data',
+                 trading_data_path: str = 'system/trading-data') -> None:
+        """
+        Initializes a new instance of the Form4Export class, which streams a selection of the Form 4 lake to a file in fixed-size chunks.
+
+        Parameters:
+        ciks (List[str], optional): Parent CIKs to export. Defaults to None, which exports every CIK.
+        start_date (str, optional): First transaction date to export. Must be in YYYY-MM-DD format. Defaults to None.
+        end_date (str, optional): Last transaction date to export. Must be in YYYY-MM-DD format. Defaults to None.
+        tickers (List[str], optional): Tickers to export. Defaults to None, which exports every ticker.
+        enrich (bool, optional): Whether to join the stock data of the trading-data lake to each transaction. Defaults to False.
+        batch_size (int, optional): Maximum number of rows read and written at once. Defaults to 65536.
+        parquet_path (str, optional): The path of the Form 4 lake. Defaults to 'system/form4/data'.
+        trading_data_path (str, optional): The path of the trading-data lake. Defaults to 'system/trading-data'.
+        """
+        self.ciks = [cik.lstrip('0') for cik in ciks] if ciks is not None else None
+        self.start_date = start_date
+        self.end_date = end_date
+        self.tickers = tickers
+        self.enrich = enrich
+        self.batch_size = batch_size
+        self.parquet_path = parquet_path
+        self.trading_data_path = trading_data_path
+
+    def partitions(self) -> List[str]:
+        """
+        Lists the parent CIKs of the lake matching the selection.
+
+        Returns:
+        List[str]: The parent CIKs.
+        """
+        if not os.path.isdir(self.parquet_path):
+            return []
+        ciks = [partition.split('=')[1] for partition in sorted(os.listdir(self.parquet_path))
+                if partition.startswith('parent_cik=')]
+        if self.ciks is not None:
+            ciks = [cik for cik in ciks if cik in self.ciks]
+        return ciks
+
+    def read_trading_data(self, cik: str) -> pa.Table:
+        """
+        Reads the stock data of a parent CIK, one row per hash.
+        """
+        if not os.path.isdir(os.path.join(self.trading_data_path, 'parent_cik=' + cik)):
+            return Form4Export.trading_data_schema.empty_table()
+        df = pd.read_parquet(self.trading_data_path, engine='pyarrow',
+                             columns=Form4Export.trading_data_schema.names,
+                             filters=[('parent_cik', '=', int(cik))])
+        df = df.drop_duplicates(subset=['hash'])
+        return pa.Table.from_pandas(df, schema=Form4Export.trading_data_schema, preserve_index=False)
+
+    @ staticmethod
+    def decode(table: pa.Table) -> pa.Table:
+        """
+        Converts a chunk of the lake to the export layout: plain string columns and the 'form4_link' URL
+        instead of 'accession' and 'form4_filename'.
+        """
+        columns = []
+        for name in table.column_names:
+            column = table.column(name)
+            if pa.types.is_dictionary(column.type):
+                column = column.cast(column.type.value_type)
+            columns.append(column)
+        table = pa.Table.from_arrays(columns, names=table.column_names)
+
+        form4_link = pc.binary_join_element_wise(
+            Form4.base_url + Form4.base_path,
+            table.column('parent_cik').cast(pa.string()), '/',
+            pc.utf8_lpad(table.column('accession').cast(pa.string()), width=18, padding='0'), '/',
+            table.column('form4_filename'), '')
+        table = table.drop(['accession', 'form4_filename'])
+        return table.append_column('form4_link', form4_link)
+
+    def iter_tables(self, cik: str):
+        """
+        Streams the selected rows of a parent CIK in chunks of at most batch_size rows.
+
+        Parameters:
+        cik (str): The parent CIK.
+        """
+        dataset = ds.dataset(self.parquet_path, schema=Form4.pa_schema, format='parquet',
+                             partitioning=ds.partitioning(pa.schema([('parent_cik', pa.int64())]), flavor='hive'))
+        expression = ds.field('parent_cik') == int(cik)
+        if self.start_date is not None:
+            expression = expression & (ds.field('transaction_date') >= pd.Timestamp(self.start_date).date())
+        if self.end_date is not None:
+            expression = expression & (ds.field('transaction_date') <= pd.Timestamp(self.end_date).date())
+        enrichment = self.read_trading_data(cik) if self.enrich else None
+
+        for batch in dataset.to_batches(filter=expression, batch_size=self.batch_size, use_threads=True):
+            if batch.num_rows == 0:
+                continue
+            table = Form4Export.decode(pa.Table.from_batches([batch]))
+            if self.tickers is not None:
+                table = table.filter(
+                    pc.is_in(table.column('ticker'), value_set=pa.array(self.tickers, pa.string())))
+            if enrichment is not None:
+                table = table.join(enrichment, keys='hash', join_type='left outer')
+            if table.num_rows > 0:
+                yield table
+
+    def iter_prefetched(self, ciks: List[str], max_workers: int, prefetch: int = 4):
+        """
+        Streams the selected rows of several parent CIKs in order, while up to max_workers CIKs are scanned in parallel.
+        Each CIK being scanned holds at most prefetch chunks, which bounds the memory used.
+        """
+        if max_workers <= 1 or len(ciks) <= 1:
+            for cik in ciks:
+                yield from self.iter_tables(cik)
+            return
+
+        cancel = threading.Event()
+
+        def put(tables: queue.Queue, item) -> bool:
+            while not cancel.is_set():
+                try:
+                    tables.put(item, timeout=1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        def scan(cik: str, tables: queue.Queue) -> None:
+            try:
+                for table in self.iter_tables(cik):
+                    if not put(tables, table):
+                        return
+            except Exception as e:
+                put(tables, e)
+                return
+            put(tables, None)
+
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            try:
+                pending = []
+                remaining = iter(ciks)
+                for cik in remaining:
+                    pending.append(queue.Queue(maxsize=prefetch))
+                    pool.submit(scan, cik, pending[-1])
+                    if len(pending) == max_workers:
+                        break
+                while pending:
+                    tables = pending.pop(0)
+                    # start the next CIK while this one is written
+                    for cik in remaining:
+                        pending.append(queue.Queue(maxsize=prefetch))
+                        pool.submit(scan, cik, pending[-1])
+                        break
+                    while True:
+                        table = tables.get()
+                        if table is None:
+                            break
+                        if isinstance(table, Exception):
+                            raise table
+                        yield table
+            finally:
+                # stop the scans still running, so the pool can shut down
+                cancel.set()
+
+    @ staticmethod
+    def open_writer(path: str, schema: pa.Schema, format: str):
+        if format == 'csv':
+            return csv.CSVWriter(path, schema, write_options=csv.WriteOptions(delimiter='|'))
+        if format == 'parquet':
+            return pq.ParquetWriter(path, schema)
+        if format == 'arrow':
+            return pa.ipc.new_file(path, schema)
+        raise ValueError(f"Unknown export format '{format}'. Use one of {list(Form4Export.formats)}.")
+
+    def write(self, path: str, format: str, ciks: List[str], max_workers: int = 1) -> int:
+        """
+        Writes the selected rows of some parent CIKs to a single file, one chunk at a time,
+        scanning up to max_workers CIKs in parallel.
+
+        Returns:
+        int: The number of rows written.
+        """
+        writer = None
+        rows = 0
+        try:
+            for table in self.iter_prefetched(ciks, max_workers):
+                if writer is None:
+                    schema = table.schema
+                    writer = Form4Export.open_writer(path, schema, format)
+                writer.write_table(table.select(schema.names).cast(schema))
+                rows += table.num_rows
+        finally:
+            if writer is not None:
+                writer.close()
+        return rows
+
+    def export(self, path: str, format: str = 'csv', per_partition: bool = False, max_workers: int = 4) -> int:
+        """
+        Exports the selection to CSV (pipe-separated), Parquet or Arrow IPC/Feather.
+
+        Parameters:
+        path (str): The file to write, or the directory to write one file per parent CIK to when per_partition is True.
+        format (str, optional): 'csv', 'parquet' or 'arrow'. Defaults to 'csv'.
+        per_partition (bool, optional): Whether to write one file per parent CIK, in parallel. Defaults to False.
+        max_workers (int, optional): Number of parent CIKs scanned at the same time, each written to its own file when per_partition is True. Defaults to 4.
+
+        Returns:
+        int: The number of rows exported.
+        """
+        if format not in Form4Export.formats:
+            raise ValueError(f"Unknown export format '{format}'. Use one of {list(Form4Export.formats)}.")
+        Form4.check_system_data(self.parquet_path)
+        ciks = self.partitions()
+
+        if per_partition:
+            os.makedirs(path, exist_ok=True)
+            with ThreadPoolExecutor(max_workers=max_workers) as pool:
+                rows = sum(pool.map(lambda cik: self.write(
+                    os.path.join(path, 'parent_cik=' + cik + Form4Export.formats[format]), format, [cik]), ciks))
+        else:
+            directory = os.path.dirname(path)
+            if directory and not os.path.exists(directory):
+                os.makedirs(directory)
+            rows = self.write(path, format, ciks, max_workers=max_workers)
+
+        print(f"Exported {rows} rows of {len(ciks)} CIKs to {path}.")
+        return rows
@@ -0,0 +1,136 @@
+import queue
+import threading
+from typing import List
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from ClassForm4 import Form4
+
+
+class Form4Pipeline:
+    def __init__(self, ciks: List[str], start_date: str = None, end_date: str = None, days_range: int = 0,
+                 io_workers: int = 4, parse_workers: int = None, queue_size: int = 64,
+                 max_requests_per_second: float = 10, system_path: str = 'system') -> None:
+        """
+        Initializes a new instance of the Form4Pipeline class, which scrapes several CIKs in three stages:
+        I/O threads download the Form 4 XML documents, a process pool parses them, and a single writer syncs each CIK to Parquet.
+
+        Parameters:
+        ciks (List[str]): The CIK numbers to scrape.
+        start_date (str, optional): The start date to filter the search results by. Must be in YYYY-MM-DD format. Defaults to None.
+        end_date (str, optional): The end date to filter the search results by. Must be in YYYY-MM-DD format. Defaults to None.
+        days_range (int, optional): Defaults to 0.
+        io_workers (int, optional): Number of threads downloading from SEC.gov. Defaults to 4.
+        parse_workers (int, optional): Number of parsing processes. Defaults to None, which uses all the cores.
+        queue_size (int, optional): Maximum number of documents waiting between two stages. Bounds the memory used. Defaults to 64.
+        max_requests_per_second (float, optional): SEC request budget shared by the I/O threads. Defaults to 10.
+        system_path (str, optional): The root directory the data is written to. Defaults to 'system'.
+        """
+        self.ciks = ciks
+        self.start_date = start_date
+        self.end_date = end_date
+        self.days_range = days_range
+        self.io_workers = io_workers
+        self.parse_workers = parse_workers
+        self.queue_size = queue_size
+        self.max_requests_per_second = max_requests_per_second
+        self.system_path = system_path
+        # set when the run fails, so the I/O threads stop instead of blocking on a full queue
+        self.cancel = threading.Event()
+
+    def put(self, raw_queue: queue.Queue, item: tuple) -> bool:
+        # waits for room in the queue unless the run is cancelled
+        while True:
+            try:
+                raw_queue.put(item, timeout=1)
+                return True
+            except queue.Full:
+                if self.cancel.is_set():
+                    return False
+
+    def fetch_cik(self, cik: str, raw_queue: queue.Queue) -> None:
+        """
+        I/O stage: finds the new operations of a CIK and puts the raw XML of its Form 4 documents in the queue,
+        followed by an end marker for the CIK. The end marker tells whether every document was fetched,
+        with no Form4 when it could not be created.
+        """
+        form4 = None
+        completed = False
+        try:
+            if self.cancel.is_set():
+                return
+            form4 = Form4(cik, self.start_date, self.end_date, self.days_range,
+                          system_path=self.system_path, run=False)
+            form4.get_operation_ids()
+            for form4_link in form4.iter_form4_links():
+                if self.cancel.is_set() or not self.put(
+                        raw_queue, (form4, form4_link, form4.fetch(form4_link).content)):
+                    return
+            completed = True
+        except Exception as e:
+            print(f"CIK: '{cik}'| Unable to scrape form 4: {e}")
+        finally:
+            self.put(raw_queue, (form4, None, completed))
+
+    def write(self, write_queue: queue.Queue) -> None:
+        """
+        Writer stage: collects the parsed transactions of each CIK and syncs the CIK once its end marker arrives.
+        A CIK whose documents were not all fetched is not synced, so none of its operations are marked as scraped,
+        and a document that fails to parse is left out of the scraped operations.
+        """
+        while True:
+            form4, form4_link, parsed = write_queue.get()
+            if form4 is None:
+                break
+            if form4_link is not None:
+                try:
+                    form4.data.extend(parsed.result())
+                except Exception as e:
+                    print(f"CIK: '{form4.cik}'| Unable to parse form 4: {e}")
+                    accession = form4_link.split('/')[-2]
+                    form4.operation_ids = [
+                        op_id for op_id in form4.operation_ids if op_id != accession]
+            elif not parsed:
+                print(
+                    f"CIK: '{form4.cik}'| Not synced, the scrape did not complete.")
+            else:
+                try:
+                    form4.sync_system_data()
+                except:
+                    print(f"Unable to permorm Data Sync for {form4.cik}")
+
+    def run(self) -> None:
+        """
+        Runs the three stages until every CIK is synced.
+        """
+        max_requests_per_second = Form4.max_requests_per_second
+        Form4.max_requests_per_second = self.max_requests_per_second
+        self.cancel.clear()
+        # bounded queues, so a slow stage blocks the stages before it
+        raw_queue = queue.Queue(maxsize=self.queue_size)
+        write_queue = queue.Queue(maxsize=self.queue_size)
+        writer = threading.Thread(target=self.write, args=(write_queue,))
+        writer.start()
+        try:
+            with ThreadPoolExecutor(max_workers=self.io_workers) as io_pool, \
+                    ProcessPoolExecutor(max_workers=self.parse_workers) as parse_pool:
+                try:
+                    for cik in self.ciks:
+                        io_pool.submit(self.fetch_cik, cik, raw_queue)
+
+                    pending_ciks = len(self.ciks)
+                    while pending_ciks > 0:
+                        form4, form4_link, item = raw_queue.get()
+                        if form4_link is None:
+                            if form4 is not None:
+                                write_queue.put((form4, None, item))
+                            pending_ciks -= 1
+                        else:
+                            write_queue.put((form4, form4_link, parse_pool.submit(
+                                Form4.parse_form4, item, form4_link, form4.cik)))
+                except BaseException:
+                    # stop the I/O threads, so the pools can shut down
+                    self.cancel.set()
+                    raise
+        finally:
+            write_queue.put((None, None, None))
+            writer.join()
+            Form4.max_requests_per_second = max_requests_per_second
@@ -0,0 +1,354 @@
+import os
+import uuid
+import shutil
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+
+
+class InsiderGraph:
+    # one pointer per owner, issuer, filing and row group of the Form 4 lake
+    # the issuer is the 'cik' column, parent_cik only tells which partition holds the row group
+    pointer_columns = ['rptOwnerCik', 'cik', 'accession', 'parent_cik', 'file', 'mtime', 'row_group',
+                       'rptOwnerName', 'transactions', 'first_date', 'last_date']
+    edge_columns = ['rptOwnerCik', 'cik', 'rptOwnerName',
+                    'transactions', 'first_date', 'last_date']
+    # pointers of the earlier versions, keyed on the partition instead of the issuer
+    legacy_file_name = 'pointers.parquet'
+
+    def __init__(self, system_path: str = 'system') -> None:
+        """
+        Initializes a new instance of the InsiderGraph class, the bipartite index of reporting owners (rptOwnerCik)
+        to issuers (cik) across the whole Form 4 lake, with the row groups holding each edge's transactions.
+        The row-group pointers are persisted per parent CIK, so parallel syncs of different CIKs never write the same file.
+
+        Parameters:
+        system_path (str, optional): The root directory of the system data. Defaults to 'system'.
+        """
+        self.parquet_path = system_path + '/form4/data'
+        self.graph_path = system_path + '/form4/insider-graph'
+        # replaced whenever a pointers file changes, so a single stat tells whether the index is fresh
+        self.manifest_file = os.path.join(self.graph_path, 'manifest')
+        # in-memory index, reloaded when the manifest changes
+        self.index = None
+        self.index_version = None
+
+    def partition_file(self, cik: str) -> str:
+        return os.path.join(self.graph_path, 'parent_cik=' + str(cik).lstrip('0'), 'filings.parquet')
+
+    def read(self, cik: str) -> pd.DataFrame:
+        """
+        Reads the row-group pointers of a parent CIK.
+
+        Parameters:
+        cik (str): The parent CIK.
+
+        Returns:
+        DataFrame: One row per owner, issuer, filing and row group of the CIK's lake files.
+        """
+        file_path = self.partition_file(cik)
+        if not os.path.exists(file_path):
+            return pd.DataFrame(columns=InsiderGraph.pointer_columns)
+        df = pd.read_parquet(file_path, engine='pyarrow')
+        df['first_date'] = pd.to_datetime(df['first_date'])
+        df['last_date'] = pd.to_datetime(df['last_date'])
+        return df
+
+    def write(self, cik: str, df: pd.DataFrame) -> None:
+        """
+        Sorts and saves the row-group pointers of a parent CIK, replacing the previous ones.
+        """
+        df = df[InsiderGraph.pointer_columns].sort_values(
+            ['rptOwnerCik', 'cik', 'file', 'row_group'], kind='mergesort')
+        df['first_date'] = pd.to_datetime(df['first_date']).dt.date
+        df['last_date'] = pd.to_datetime(df['last_date']).dt.date
+        file_path = self.partition_file(cik)
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        tmp_path = file_path + '.tmp'
+        df.to_parquet(tmp_path, engine='pyarrow', index=False)
+        os.replace(tmp_path, file_path)
+        self.touch_manifest()
+
+    def touch_manifest(self) -> None:
+        # a new file each time, so its inode changes even within the mtime resolution of the file system
+        os.makedirs(self.graph_path, exist_ok=True)
+        tmp_path = f'{self.manifest_file}.{uuid.uuid4().hex}.tmp'
+        with open(tmp_path, 'w') as manifest:
+            manifest.write(uuid.uuid4().hex)
+        os.replace(tmp_path, self.manifest_file)
+
+    def version(self) -> tuple:
+        # identity of the current manifest, None when the index is empty
+        if not os.path.exists(self.manifest_file):
+            return None
+        stat = os.stat(self.manifest_file)
+        return stat.st_ino, stat.st_mtime_ns
+
+    @ staticmethod
+    def scan_file(parquet_path: str, file: str) -> pd.DataFrame:
+        """
+        Reads the owners, issuers and filings of every row group of a lake file, without reading the transactions themselves.
+
+        Parameters:
+        parquet_path (str): The path of the Form 4 lake.
+        file (str): The file, relative to the lake ('parent_cik=<cik>/<name>.parquet').
+
+        Returns:
+        DataFrame: The pointers of the file.
+        """
+        file_path = os.path.join(parquet_path, file)
+        parquet_file = pq.ParquetFile(file_path)
+        row_groups = []
+        for row_group in range(parquet_file.num_row_groups):
+            df = parquet_file.read_row_group(
+                row_group, columns=['rptOwnerCik', 'cik', 'accession', 'rptOwnerName', 'transaction_date']).to_pandas()
+            df['rptOwnerCik'] = pd.to_numeric(df['rptOwnerCik'], errors='coerce').astype('Int64')
+            df['cik'] = pd.to_numeric(df['cik'], errors='coerce').astype('Int64')
+            df['accession'] = pd.to_numeric(df['accession'], errors='coerce').fillna(-1).astype(np.int64)
+            df['rptOwnerName'] = df['rptOwnerName'].astype(str)
+            df['transaction_date'] = pd.to_datetime(df['transaction_date'], errors='coerce')
+            df = df[df['rptOwnerCik'].notnull() & df['cik'].notnull()]
+            if len(df) == 0:
+                continue
+            pointers = df.groupby(['rptOwnerCik', 'cik', 'accession']).agg(
+                rptOwnerName=('rptOwnerName', 'last'), transactions=('rptOwnerName', 'size'),
+                first_date=('transaction_date', 'min'), last_date=('transaction_date', 'max')).reset_index()
+            pointers['row_group'] = row_group
+            row_groups.append(pointers)
+
+        if len(row_groups) == 0:
+            return pd.DataFrame(columns=InsiderGraph.pointer_columns)
+        df = pd.concat(row_groups, ignore_index=True)
+        df['rptOwnerCik'] = df['rptOwnerCik'].astype(np.int64)
+        df['cik'] = df['cik'].astype(np.int64)
+        df['parent_cik'] = int(file.split('/')[0].split('=')[1])
+        df['file'] = file
+        df['mtime'] = os.path.getmtime(file_path)
+        return df[InsiderGraph.pointer_columns]
+
+    @ staticmethod
+    def partitions(path: str) -> list:
+        # the parent CIKs of a partitioned directory
+        if not os.path.isdir(path):
+            return []
+        return [partition.split('=')[1] for partition in sorted(os.listdir(path))
+                if partition.startswith('parent_cik=')]
+
+    def list_files(self, cik: str) -> dict:
+        # the Parquet files of a lake partition and their modification times
+        partition = 'parent_cik=' + cik
+        partition_path = os.path.join(self.parquet_path, partition)
+        if not os.path.isdir(partition_path):
+            return {}
+        return {partition + '/' + file_name: os.path.getmtime(os.path.join(partition_path, file_name))
+                for file_name in sorted(os.listdir(partition_path)) if file_name.endswith('.parquet')}
+
+    def update(self, ciks: list = None) -> int:
+        """
+        Brings the index up to date with the lake: only the files added or rewritten since the last update are scanned,
+        and the pointers of removed files are dropped.
+
+        Parameters:
+        ciks (list, optional): Parent CIKs to check. Defaults to None, which checks every partition.
+
+        Returns:
+        int: The number of files scanned.
+        """
+        from ClassForm4 import Form4
+
+        if ciks is None:
+            ciks = sorted(set(InsiderGraph.partitions(self.parquet_path)) |
+                          set(InsiderGraph.partitions(self.graph_path)))
+        scanned_files = 0
+        for cik in [str(cik).lstrip('0') for cik in ciks]:
+            Form4.check_system_data(self.parquet_path, [cik])
+            legacy_file = os.path.join(os.path.dirname(self.partition_file(cik)), InsiderGraph.legacy_file_name)
+            if os.path.exists(legacy_file):
+                # the legacy pointers have no issuer column, the partition is scanned again below
+                os.remove(legacy_file)
+                self.touch_manifest()
+            files = self.list_files(cik)
+            if len(files) == 0:
+                # the partition was removed from the lake
+                if os.path.exists(self.partition_file(cik)):
+                    os.remove(self.partition_file(cik))
+                    self.touch_manifest()
+                continue
+
+            pointers = self.read(cik)
+            # pointers of files that were removed or rewritten since they were scanned are dropped
+            keep = pointers['file'].map(files) == pointers['mtime']
+            indexed_files = set(pointers.loc[keep, 'file'])
+            new_files = [file for file in files if file not in indexed_files]
+            if len(new_files) == 0 and keep.all():
+                continue
+
+            scanned = [InsiderGraph.scan_file(self.parquet_path, file) for file in new_files]
+            self.write(cik, pd.concat([pointers[keep]] + scanned, ignore_index=True))
+            scanned_files += len(new_files)
+            print(f"CIK: '{cik}'| Indexed the owners of {len(new_files)} files.")
+        return scanned_files
+
+    def rebuild(self) -> None:
+        """
+        Rebuilds the index from the whole Form 4 lake.
+        """
+        shutil.rmtree(self.graph_path, ignore_errors=True)
+        self.index = None
+        self.update()
+
+    def load_index(self) -> dict:
+        """
+        Loads the edges of the index, sorted by owner and by issuer, so every lookup is a binary search.
+        A filing stored under both the issuer and the reporting owner partitions is counted once.
+        The pointers are read again only when the manifest changed since they were loaded.
+
+        Returns:
+        dict: The index.
+        """
+        version = self.version()
+        if self.index is not None and self.index_version == version:
+            return self.index
+
+        pointers = pd.concat([self.read(cik) for cik in InsiderGraph.partitions(self.graph_path)] +
+                             [pd.DataFrame(columns=InsiderGraph.pointer_columns)], ignore_index=True)
+        pointers['rptOwnerCik'] = pointers['rptOwnerCik'].astype(np.int64)
+        pointers['cik'] = pointers['cik'].astype(np.int64)
+        pointers['accession'] = pointers['accession'].astype(np.int64)
+        pointers['parent_cik'] = pointers['parent_cik'].astype(np.int64)
+        # each copy of a filing, possibly spread over several row groups, then one copy per filing
+        filings = pointers.groupby(['rptOwnerCik', 'cik', 'accession', 'parent_cik'], sort=True).agg(
+            rptOwnerName=('rptOwnerName', 'last'), transactions=('transactions', 'sum'),
+            first_date=('first_date', 'min'), last_date=('last_date', 'max')).reset_index()
+        filings = filings.drop_duplicates(subset=['rptOwnerCik', 'cik', 'accession'])
+        edges = filings.groupby(['rptOwnerCik', 'cik'], sort=True).agg(
+            rptOwnerName=('rptOwnerName', 'last'), transactions=('transactions', 'sum'),
+            first_date=('first_date', 'min'), last_date=('last_date', 'max')).reset_index()[InsiderGraph.edge_columns]
+        by_issuer = edges.sort_values(['cik', 'rptOwnerCik'], kind='mergesort').reset_index(drop=True)
+        self.index = {
+            'pointers': pointers,
+            'edges': edges,
+            'owners': edges['rptOwnerCik'].to_numpy(),
+            'by_issuer': by_issuer,
+            'issuers': by_issuer['cik'].to_numpy(),
+        }
+        self.index_version = version
+        return self.index
+
+    @ staticmethod
+    def lookup(df: pd.DataFrame, keys: np.ndarray, key: int) -> pd.DataFrame:
+        # rows of df whose sorted key column equals key
+        start, end = np.searchsorted(keys, [key, key + 1], side='left')
+        return df.iloc[start:end].reset_index(drop=True)
+
+    def edges(self) -> pd.DataFrame:
+        """
+        Returns every owner to issuer edge, with its number of transactions and date span.
+        """
+        return self.load_index()['edges']
+
+    def issuers_for_owner(self, owner_cik: int) -> pd.DataFrame:
+        """
+        Returns the issuers an owner filed for.
+
+        Parameters:
+        owner_cik (int): The rptOwnerCik of the owner.
+
+        Returns:
+        DataFrame: The edges of the owner.
+        """
+        index = self.load_index()
+        return InsiderGraph.lookup(index['edges'], index['owners'], int(owner_cik))
+
+    def owners_for_issuer(self, cik: str) -> pd.DataFrame:
+        """
+        Returns the owners who filed for an issuer, whichever partition holds their filings.
+
+        Parameters:
+        cik (str): The issuer CIK.
+
+        Returns:
+        DataFrame: The edges of the issuer.
+        """
+        index = self.load_index()
+        return InsiderGraph.lookup(index['by_issuer'], index['issuers'], int(cik))
+
+    def shared_insiders(self, cik_a: str, cik_b: str) -> pd.DataFrame:
+        """
+        Returns the owners who filed for both issuers, e.g. shared directors.
+
+        Parameters:
+        cik_a (str): The first issuer CIK.
+        cik_b (str): The second issuer CIK.
+
+        Returns:
+        DataFrame: One row per shared owner with the transactions and date span of both edges.
+        """
+        owners_a = self.owners_for_issuer(cik_a).drop(columns=['cik'])
+        owners_b = self.owners_for_issuer(cik_b).drop(columns=['cik', 'rptOwnerName'])
+        return owners_a.merge(owners_b, on='rptOwnerCik', suffixes=('_a', '_b'))
+
+    def connected_issuers(self, cik: str) -> pd.DataFrame:
+        """
+        Returns the issuers sharing at least one owner with an issuer.
+
+        Parameters:
+        cik (str): The issuer CIK.
+
+        Returns:
+        DataFrame: The connected issuers and their number of shared owners, most connected first.
+        """
+        index = self.load_index()
+        owners = self.owners_for_issuer(cik)['rptOwnerCik'].to_numpy()
+        starts = np.searchsorted(index['owners'], owners, side='left')
+        ends = np.searchsorted(index['owners'], owners, side='right')
+        rows = np.concatenate([np.arange(start, end) for start, end in zip(starts, ends)]) \
+            if len(owners) > 0 else np.array([], dtype=np.int64)
+        edges = index['edges'].iloc[rows]
+        edges = edges[edges['cik'] != int(cik)]
+        connected = edges.groupby('cik').agg(shared_owners=('rptOwnerCik', 'nunique')).reset_index()
+        return connected.sort_values(['shared_owners', 'cik'], ascending=[False, True]).reset_index(drop=True)
+
+    def owner_transactions(self, owner_cik: int, start_date: str = None, end_date: str = None) -> pd.DataFrame:
+        """
+        Returns everything an owner traded across all the issuers, reading only the row groups the index points to.
+
+        Parameters:
+        owner_cik (int): The rptOwnerCik of the owner.
+        start_date (str, optional): First transaction date. Must be in YYYY-MM-DD format. Defaults to None.
+        end_date (str, optional): Last transaction date. Must be in YYYY-MM-DD format. Defaults to None.
+
+        Returns:
+        DataFrame: The transactions of the owner, in the compact Form 4 representation.
+        """
+        from ClassForm4 import Form4
+
+        index = self.load_index()
+        pointers = index['pointers']
+        pointers = pointers[pointers['rptOwnerCik'] == int(owner_cik)]
+        if start_date is not None:
+            pointers = pointers[pointers['last_date'] >= pd.Timestamp(start_date)]
+        if end_date is not None:
+            pointers = pointers[pointers['first_date'] <= pd.Timestamp(end_date)]
+
+        frames = []
+        for (file, parent_cik), row_groups in pointers.groupby(['file', 'parent_cik'])['row_group']:
+            file_path = os.path.join(self.parquet_path, file)
+            if not os.path.exists(file_path):
+                continue
+            df = pq.ParquetFile(file_path).read_row_groups(
+                sorted(set(row_groups.astype(int)))).to_pandas()
+            df['parent_cik'] = int(parent_cik)
+            frames.append(Form4.compact_frame(df))
+        if len(frames) == 0:
+            return pd.DataFrame(columns=Form4.pa_schema.names)
+
+        df = pd.concat(frames, ignore_index=True)
+        df = Form4.compact_frame(df[df['rptOwnerCik'] == int(owner_cik)])
+        if start_date is not None:
+            df = df[df['transaction_date'] >= pd.Timestamp(start_date)]
+        if end_date is not None:
+            df = df[df['transaction_date'] <= pd.Timestamp(end_date)]
+        # the same transaction can be filed under the issuer and the reporting owner
+        df = Form4.drop_duplicate_filings(df)
+        return df.sort_values(['transaction_date', 'parent_cik'], kind='mergesort').reset_index(drop=True)
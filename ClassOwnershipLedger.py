@@ -0,0 +1,245 @@
+import os
+import uuid
+import numpy as np
+import pandas as pd
+
+
+class OwnershipLedger:
+    # a balance is identified by issuer, owner, security and nature of ownership
+    key_columns = ['cik', 'rptOwnerCik', 'security_title',
+                   'direct_or_indirect_ownership']
+    columns = key_columns + ['rptOwnerName', 'transaction_date', 'accession',
+                             'shares_owned_following_transaction', 'hash']
+    # appended runs merged into the ledger file by update
+    max_runs = 16
+
+    def __init__(self, system_path: str = 'system') -> None:
+        """
+        Initializes a new instance of the OwnershipLedger class, the post-transaction balances of every insider,
+        persisted per parent CIK and sorted by owner, security, nature and date. Each sync appends a sorted run,
+        merged into the ledger file on read and compacted every max_runs runs.
+
+        Parameters:
+        system_path (str, optional): The root directory of the system data. Defaults to 'system'.
+        """
+        self.parquet_path = system_path + '/form4/data'
+        self.ledger_path = system_path + '/form4/ownership-ledger'
+        # as-of indexes already loaded, keyed by parent CIK
+        self.index = {}
+
+    def partition_file(self, cik: str) -> str:
+        return os.path.join(self.ledger_path, 'parent_cik=' + str(cik).lstrip('0'), 'ledger.parquet')
+
+    def run_files(self, cik: str) -> list:
+        # the sorted runs appended since the ledger was last compacted, oldest first
+        partition_path = os.path.dirname(self.partition_file(cik))
+        if not os.path.isdir(partition_path):
+            return []
+        runs = [os.path.join(partition_path, file_name) for file_name in os.listdir(partition_path)
+                if file_name.startswith('run-') and file_name.endswith('.parquet')]
+        return sorted(runs, key=os.path.getmtime)
+
+    @ staticmethod
+    def sort_rows(df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Converts ledger rows to the stored representation and sorts them by owner, security, nature and date.
+
+        Parameters:
+        df (DataFrame): The ledger rows.
+
+        Returns:
+        DataFrame: The sorted rows, without duplicates or undated rows.
+        """
+        df = df[OwnershipLedger.columns].copy()
+        for col in ['security_title', 'direct_or_indirect_ownership', 'rptOwnerName']:
+            # a missing security or nature is a key of its own, not the string 'nan'
+            df[col] = df[col].astype(object).fillna('').astype(str)
+        df['transaction_date'] = pd.to_datetime(df['transaction_date'])
+        df = df[df['transaction_date'].notnull()].drop_duplicates(subset=['hash'])
+        # the accession breaks ties between balances reported on the same date
+        return df.sort_values(OwnershipLedger.key_columns + ['transaction_date', 'accession'],
+                              na_position='last', kind='mergesort')
+
+    def read(self, cik: str) -> pd.DataFrame:
+        """
+        Reads the ledger of a parent CIK, merging the runs appended since its last compaction.
+
+        Parameters:
+        cik (str): The parent CIK.
+
+        Returns:
+        DataFrame: The ledger rows, sorted.
+        """
+        files = [self.partition_file(cik)] + self.run_files(cik)
+        frames = [pd.read_parquet(file_path, engine='pyarrow') for file_path in files if os.path.exists(file_path)]
+        if len(frames) == 0:
+            return pd.DataFrame(columns=OwnershipLedger.columns)
+        df = frames[0] if len(frames) == 1 else OwnershipLedger.sort_rows(pd.concat(frames, ignore_index=True))
+        df['transaction_date'] = pd.to_datetime(df['transaction_date'])
+        return df
+
+    def save(self, file_path: str, df: pd.DataFrame) -> None:
+        # atomically writes sorted ledger rows
+        df = df.copy()
+        df['transaction_date'] = df['transaction_date'].dt.date
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        tmp_path = file_path + '.tmp'
+        df.to_parquet(tmp_path, engine='pyarrow', index=False)
+        os.replace(tmp_path, file_path)
+
+    def write(self, cik: str, df: pd.DataFrame) -> None:
+        """
+        Sorts and saves the ledger of a parent CIK, replacing the previous one and its runs.
+
+        Parameters:
+        cik (str): The parent CIK.
+        df (DataFrame): The ledger rows.
+        """
+        runs = self.run_files(cik)
+        self.save(self.partition_file(cik), OwnershipLedger.sort_rows(df))
+        for run in runs:
+            os.remove(run)
+        self.index.pop(str(cik).lstrip('0'), None)
+
+    def compact(self, cik: str) -> None:
+        """
+        Merges the runs of a parent CIK into its ledger file.
+
+        Parameters:
+        cik (str): The parent CIK.
+        """
+        runs = self.run_files(cik)
+        df = self.read(cik)
+        self.save(self.partition_file(cik), OwnershipLedger.sort_rows(df))
+        # runs appended while compacting are kept for the next read
+        for run in runs:
+            os.remove(run)
+        self.index.pop(str(cik).lstrip('0'), None)
+
+    def read_lake(self, cik: str) -> pd.DataFrame:
+        # the ledger rows of a lake partition
+        from ClassForm4 import Form4
+
+        Form4.check_system_data(self.parquet_path, [cik])
+        return pd.read_parquet(self.parquet_path, engine='pyarrow', schema=Form4.pa_schema,
+                               columns=OwnershipLedger.columns, filters=[('parent_cik', '=', int(cik))])
+
+    def rebuild(self, cik: str) -> None:
+        """
+        Rebuilds the ledger of a parent CIK from the Form 4 lake.
+
+        Parameters:
+        cik (str): The parent CIK.
+        """
+        cik = str(cik).lstrip('0')
+        self.write(cik, self.read_lake(cik))
+
+    def rebuild_all(self) -> int:
+        """
+        Rebuilds the ledger of every parent CIK of the Form 4 lake.
+
+        Returns:
+        int: The number of ledgers rebuilt.
+        """
+        if not os.path.isdir(self.parquet_path):
+            return 0
+        ciks = [partition.split('=')[1] for partition in sorted(os.listdir(self.parquet_path))
+                if partition.startswith('parent_cik=')]
+        for cik in ciks:
+            self.rebuild(cik)
+        print(f"Rebuilt the ownership ledger of {len(ciks)} CIKs.")
+        return len(ciks)
+
+    def update(self, cik: str, df: pd.DataFrame) -> None:
+        """
+        Adds the rows just synced to the Form 4 lake to the ledger of their parent CIK, as a new sorted run.
+        The runs are merged into the ledger file once there are max_runs of them.
+
+        Parameters:
+        cik (str): The parent CIK.
+        df (DataFrame): The new rows, in the compact Form 4 representation.
+        """
+        if not os.path.exists(self.partition_file(cik)):
+            # first ledger of the CIK, the lake already holds the new rows
+            self.rebuild(cik)
+            return
+        run_file = os.path.join(os.path.dirname(self.partition_file(cik)), f'run-{uuid.uuid4().hex}.parquet')
+        self.save(run_file, OwnershipLedger.sort_rows(df))
+        self.index.pop(str(cik).lstrip('0'), None)
+        if len(self.run_files(cik)) >= self.max_runs:
+            self.compact(cik)
+
+    def load_index(self, cik: str) -> dict:
+        """
+        Loads the as-of index of a parent CIK: the sorted ledger with one integer key per row
+        (group * span + day), so every balance lookup is a binary search.
+
+        Parameters:
+        cik (str): The parent CIK.
+
+        Returns:
+        dict: The index.
+        """
+        cik = str(cik).lstrip('0')
+        if cik in self.index:
+            return self.index[cik]
+
+        if not os.path.exists(self.partition_file(cik)) and \
+                os.path.isdir(os.path.join(self.parquet_path, 'parent_cik=' + cik)):
+            # partition synced before the ledger existed, built in memory until rebuild() persists it
+            df = OwnershipLedger.sort_rows(self.read_lake(cik)).reset_index(drop=True)
+        else:
+            df = self.read(cik).reset_index(drop=True)
+        days = df['transaction_date'].values.astype(
+            'datetime64[D]').astype(np.int64)
+        span = int(days.max()) + 1 if len(days) > 0 else 1
+        groups = df.groupby(OwnershipLedger.key_columns,
+                            sort=False, dropna=False).ngroup().to_numpy()
+        n_groups = int(groups.max()) + 1 if len(groups) > 0 else 0
+        keys = groups.astype(np.int64) * span + days
+        self.index[cik] = {
+            'frame': df,
+            'keys': keys,
+            'span': span,
+            'group_start': np.searchsorted(keys, np.arange(n_groups, dtype=np.int64) * span, side='left'),
+        }
+        return self.index[cik]
+
+    def as_of(self, cik: str, date) -> pd.DataFrame:
+        """
+        Returns who held what on a given date: the latest balance of every owner, security and nature on or before it.
+
+        Parameters:
+        cik (str): The parent CIK.
+        date: The date, as a string in YYYY-MM-DD format or a date.
+
+        Returns:
+        DataFrame: The positive balances on that date.
+        """
+        index = self.load_index(cik)
+        n_groups = len(index['group_start'])
+        day = int((np.datetime64(pd.Timestamp(date).date(), 'D') -
+                   np.datetime64('1970-01-01', 'D')).astype(np.int64))
+        if n_groups == 0 or day < 0:
+            return index['frame'].iloc[0:0]
+
+        day = min(day, index['span'] - 1)
+        query_keys = np.arange(n_groups, dtype=np.int64) * index['span'] + day
+        positions = np.searchsorted(index['keys'], query_keys, side='right') - 1
+        positions = positions[positions >= index['group_start']]
+        balances = index['frame'].iloc[positions]
+        return balances[balances['shares_owned_following_transaction'] > 0].reset_index(drop=True)
+
+    def history(self, cik: str, owner_cik: int) -> pd.DataFrame:
+        """
+        Returns the balances of an owner in the securities of a parent CIK over time.
+
+        Parameters:
+        cik (str): The parent CIK.
+        owner_cik (int): The rptOwnerCik of the owner.
+
+        Returns:
+        DataFrame: The ledger rows of the owner.
+        """
+        df = self.load_index(cik)['frame']
+        return df[df['rptOwnerCik'] == int(owner_cik)].reset_index(drop=True)
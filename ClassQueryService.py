@@ -0,0 +1,283 @@
+import os
+import json
+import threading
+import pandas as pd
+from collections import OrderedDict
+import pyarrow.parquet as pq
+from typing import Dict
+from urllib.parse import urlparse, parse_qsl
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from ClassForm4 import Form4
+from ClassOwnershipLedger import OwnershipLedger
+from ClassInsiderGraph import InsiderGraph
+
+
+class QueryService:
+    # columns a client can aggregate by
+    group_columns = ['code', 'acquired_disposed_code', 'rptOwnerName', 'officerTitle', 'security_title',
+                     'direct_or_indirect_ownership', 'isDirector', 'isOfficer', 'isTenPercentOwner', 'ticker']
+    # stock data columns joined from the trading-data lake
+    trading_data_columns = ['hash', 'open', 'high', 'low', 'close', 'adj_close', 'volume', 'daily_return',
+                            'percent_change', 'range', 'average_price', 'shares_value_usd']
+    # endpoints reading the data of other CIKs than the one requested, cached against every reload
+    cross_cik_paths = ['/issuers', '/owner', '/network', '/ownership']
+
+    def __init__(self, system_path: str = 'system', refresh_interval: int = 30, max_cache_bytes: int = 256 * 1024 ** 2) -> None:
+        """
+        Initializes a new instance of the QueryService class, which keeps the Form 4 and trading-data lakes in memory
+        and serves filtered transactions, aggregates and chart series as JSON.
+
+        Parameters:
+        system_path (str, optional): The root directory of the system data. Defaults to 'system'.
+        refresh_interval (int, optional): Seconds between two checks for new Parquet files. Defaults to 30.
+        max_cache_bytes (int, optional): Total size of the responses kept in the LRU cache. Defaults to 256 MB.
+        """
+        self.parquet_path = system_path + '/form4/data'
+        self.trading_data_path = system_path + '/trading-data'
+        self.refresh_interval = refresh_interval
+        self.ownership_ledger = OwnershipLedger(system_path)
+        self.insider_graph = InsiderGraph(system_path)
+        # one DataFrame per parent CIK, with the Parquet files it was loaded from
+        self.frames: Dict[str, pd.DataFrame] = {}
+        self.snapshots: Dict[str, tuple] = {}
+        # bumped when a CIK is reloaded, so its cached responses are not used anymore
+        self.generations: Dict[str, int] = {}
+        self.generation = 0
+        self.max_cache_bytes = max_cache_bytes
+        self.cache = OrderedDict()
+        self.cache_bytes = 0
+        self.cache_lock = threading.Lock()
+        self.stop = threading.Event()
+        self.refresh()
+
+    @ staticmethod
+    def snapshot(path: str) -> tuple:
+        # the files of a partition directory and their modification times
+        if not os.path.isdir(path):
+            return ()
+        return tuple(sorted((name, os.path.getmtime(os.path.join(path, name)))
+                            for name in os.listdir(path) if name.endswith('.parquet')))
+
+    def load(self, cik: str) -> pd.DataFrame:
+        """
+        Reads a parent CIK from both lakes into a single compact DataFrame.
+        """
+        Form4.check_system_data(self.parquet_path, [cik])
+        partition_path = os.path.join(self.parquet_path, 'parent_cik=' + cik)
+        schema = Form4.pa_schema.remove(
+            Form4.pa_schema.get_field_index('parent_cik'))
+        df = pq.read_table(partition_path, schema=schema).to_pandas()
+        df['parent_cik'] = int(cik)
+        df = Form4.compact_frame(df.drop_duplicates(subset=['hash']))
+
+        trading_data_partition_path = os.path.join(
+            self.trading_data_path, 'parent_cik=' + cik)
+        if os.path.isdir(trading_data_partition_path):
+            trading_data = pq.read_table(trading_data_partition_path,
+                                         columns=QueryService.trading_data_columns).to_pandas()
+            df = df.merge(trading_data.drop_duplicates(subset=['hash']), how='left', on='hash')
+        else:
+            for col in QueryService.trading_data_columns[1:]:
+                df[col] = float('nan')
+        return df.sort_values('transaction_date', kind='mergesort').reset_index(drop=True)
+
+    def refresh(self) -> int:
+        """
+        Reloads the parent CIKs whose Parquet files changed since they were loaded.
+
+        Returns:
+        int: The number of CIKs reloaded.
+        """
+        if not os.path.isdir(self.parquet_path):
+            return 0
+        reloaded = 0
+        for partition in sorted(os.listdir(self.parquet_path)):
+            if not partition.startswith('parent_cik='):
+                continue
+            cik = partition.split('=')[1]
+            snapshot = (QueryService.snapshot(os.path.join(self.parquet_path, partition)),
+                        QueryService.snapshot(os.path.join(self.trading_data_path, partition)))
+            if self.snapshots.get(cik) == snapshot:
+                continue
+            try:
+                self.frames[cik] = self.load(cik)
+            except Exception as e:
+                print(f"CIK: '{cik}'| Unable to load the lake: {e}")
+                continue
+            self.snapshots[cik] = snapshot
+            self.generations[cik] = self.generations.get(cik, 0) + 1
+            self.generation += 1
+            self.ownership_ledger.index.pop(cik, None)
+            reloaded += 1
+        if reloaded > 0:
+            print(f"Reloaded {reloaded} CIKs.")
+        return reloaded
+
+    def watch(self) -> None:
+        while not self.stop.wait(self.refresh_interval):
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"Unable to refresh the lake: {e}")
+
+    def select(self, cik: str, params: dict) -> pd.DataFrame:
+        """
+        Filters the transactions of a parent CIK by date range, owner, code and ticker.
+        """
+        df = self.frames.get(cik.lstrip('0'))
+        if df is None:
+            raise KeyError(f"Unknown CIK '{cik}'")
+        mask = pd.Series(True, index=df.index)
+        if 'start' in params:
+            mask &= df['transaction_date'] >= pd.Timestamp(params['start'])
+        if 'end' in params:
+            mask &= df['transaction_date'] <= pd.Timestamp(params['end'])
+        if 'owner' in params:
+            mask &= df['rptOwnerCik'] == int(params['owner'])
+        if 'code' in params:
+            mask &= df['code'].astype(str) == params['code']
+        if 'ticker' in params:
+            mask &= df['ticker'].astype(str) == params['ticker']
+        return df[mask]
+
+    def cached_response(self, path: str, query: tuple, generation) -> bytes:
+        """
+        Returns the JSON body of a request from the LRU cache, building it on a miss.
+        The least recently used bodies are evicted once the cache holds more than max_cache_bytes.
+        """
+        key = (path, query, generation)
+        with self.cache_lock:
+            body = self.cache.get(key)
+            if body is not None:
+                self.cache.move_to_end(key)
+                return body
+
+        body = self.build_response(path, query, generation)
+        if len(body) <= self.max_cache_bytes:
+            with self.cache_lock:
+                if key not in self.cache:
+                    self.cache[key] = body
+                    self.cache_bytes += len(body)
+                while self.cache_bytes > self.max_cache_bytes:
+                    _, evicted = self.cache.popitem(last=False)
+                    self.cache_bytes -= len(evicted)
+        return body
+
+    def build_response(self, path: str, query: tuple, generation: int) -> bytes:
+        """
+        Builds the JSON body of a request. Cached by path, query and the generation of the CIK.
+        """
+        params = dict(query)
+        if path == '/issuers':
+            issuers = [{'cik': cik, 'name': str(df['name'].iloc[0]) if len(df) > 0 else None,
+                        'tickers': sorted(df['ticker'].dropna().astype(str).unique().tolist()), 'rows': len(df)}
+                       for cik, df in sorted(self.frames.items())]
+            return json.dumps(issuers).encode('utf-8')
+        if path == '/owner':
+            # the issuers of an owner, straight from the insider graph
+            if 'owner' not in params:
+                raise ValueError("Missing parameter 'owner'")
+            edges = self.insider_graph.issuers_for_owner(int(params['owner']))
+            return edges.to_json(orient='records', date_format='iso').encode('utf-8')
+
+        if 'cik' not in params:
+            raise ValueError("Missing parameter 'cik'")
+        df = self.select(params['cik'], params)
+        if path == '/transactions':
+            body = Form4.expand_frame(df).to_json(orient='records', date_format='iso')
+        elif path == '/aggregates':
+            by = params.get('by', 'code').split(',')
+            unknown = [col for col in by if col not in QueryService.group_columns]
+            if unknown:
+                raise ValueError(f"Unable to aggregate by {unknown}")
+            aggregates = df.groupby(by, observed=True).agg(
+                transactions=('hash', 'count'), shares=('shares', 'sum'), shares_value_usd=('shares_value_usd', 'sum'))
+            body = aggregates.reset_index().to_json(orient='records')
+        elif path == '/series':
+            # daily insider volume by acquired/disposed code, with the closing price
+            volume = pd.pivot_table(df, values='shares_value_usd', index='transaction_date',
+                                    columns='acquired_disposed_code', aggfunc='sum', observed=True).fillna(0)
+            series = {'date': [d.strftime('%Y-%m-%d') for d in volume.index]}
+            for code in volume.columns:
+                series[f'volume_{code}'] = volume[code].round(4).tolist()
+            close = df.groupby('transaction_date')['close'].last().reindex(volume.index)
+            series['close'] = [None if pd.isna(c) else c for c in close]
+            body = json.dumps(series)
+        elif path == '/ownership':
+            date = params.get('date', pd.Timestamp.today().strftime('%Y-%m-%d'))
+            balances = self.ownership_ledger.as_of(params['cik'], date)
+            body = balances.to_json(orient='records', date_format='iso')
+        elif path == '/network':
+            # the owners shared with another issuer, or the issuers sharing owners with this one
+            if 'other' in params:
+                network = self.insider_graph.shared_insiders(params['cik'], params['other'])
+            else:
+                network = self.insider_graph.connected_issuers(params['cik'])
+            body = network.to_json(orient='records', date_format='iso')
+        else:
+            raise FileNotFoundError(path)
+        return body.encode('utf-8')
+
+    def respond(self, url: str) -> tuple:
+        """
+        Answers a GET request.
+
+        Parameters:
+        url (str): The request path and query string.
+
+        Returns:
+        tuple: The HTTP status code and the JSON body.
+        """
+        parsed = urlparse(url)
+        query = tuple(sorted(parse_qsl(parsed.query)))
+        cik = dict(query).get('cik', '').lstrip('0')
+        if cik and parsed.path not in QueryService.cross_cik_paths:
+            generation = self.generations.get(cik, 0)
+        else:
+            generation = (self.generation, self.insider_graph.version())
+        try:
+            return 200, self.cached_response(parsed.path, query, generation)
+        except FileNotFoundError:
+            status, message = 404, f"Unknown path '{parsed.path}'"
+        except KeyError as e:
+            status, message = 404, e.args[0]
+        except ValueError as e:
+            status, message = 400, str(e)
+        except Exception as e:
+            status, message = 500, f"Unable to answer the request: {e}"
+        return status, json.dumps({'error': message}).encode('utf-8')
+
+    def serve(self, host: str = '127.0.0.1', port: int = 8000) -> None:
+        """
+        Serves the lake over HTTP until interrupted, refreshing it in the background.
+
+        Parameters:
+        host (str, optional): Defaults to '127.0.0.1'.
+        port (int, optional): Defaults to 8000.
+        """
+        service = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                status, body = service.respond(self.path)
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        watcher = threading.Thread(target=self.watch, daemon=True)
+        watcher.start()
+        server = ThreadingHTTPServer((host, port), Handler)
+        server.daemon_threads = True
+        print(f"Serving {len(self.frames)} CIKs on http://{host}:{port}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop.set()
+            server.server_close()
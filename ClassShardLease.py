@@ -0,0 +1,141 @@
+import json
+import time
+import sqlite3
+import threading
+from typing import List, Optional, Tuple
+
+
+class ShardLease:
+    def __init__(self, path: str = 'system/leases.sqlite', lease_seconds: int = 600) -> None:
+        """
+        Initializes a new instance of the ShardLease class, a store of CIK shards that nodes claim through expiring leases.
+
+        Parameters:
+        path (str, optional): The SQLite file of the store, usually on storage shared by all the nodes. ':memory:' keeps it in the current process. Defaults to 'system/leases.sqlite'.
+        lease_seconds (int, optional): Seconds a lease lasts without a heartbeat before its shard can be claimed by another node. Defaults to 600.
+        """
+        self.path = path
+        self.lease_seconds = lease_seconds
+        # a single connection shared with the heartbeat thread
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(
+            path, timeout=60, isolation_level=None, check_same_thread=False)
+        self.connection.execute('''
+            CREATE TABLE IF NOT EXISTS shards (
+                shard_id INTEGER PRIMARY KEY,
+                ciks TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                node_id TEXT,
+                expires_at REAL,
+                attempts INTEGER NOT NULL DEFAULT 0
+            )''')
+
+    def add_shards(self, ciks: List[str], shard_size: int = 10) -> None:
+        """
+        Splits the CIKs into shards and adds them to the store. Shards that already exist are left untouched, so every node can call it with the same universe.
+
+        Parameters:
+        ciks (List[str]): The CIK numbers to process.
+        shard_size (int, optional): Number of CIKs per shard. Defaults to 10.
+        """
+        # Remove leading zeros and duplicates, keeping the original order
+        ciks = list(dict.fromkeys(cik.lstrip('0') for cik in ciks))
+        shards = [(i // shard_size, json.dumps(ciks[i:i + shard_size]))
+                  for i in range(0, len(ciks), shard_size)]
+        with self.lock:
+            self.connection.executemany(
+                'INSERT OR IGNORE INTO shards (shard_id, ciks) VALUES (?, ?)', shards)
+
+    def claim(self, node_id: str) -> Optional[Tuple[int, List[str]]]:
+        """
+        Claims a pending shard, or a shard whose lease expired because its node stopped sending heartbeats.
+
+        Parameters:
+        node_id (str): The node claiming the shard.
+
+        Returns:
+        Optional[Tuple[int, List[str]]]: The shard ID and its CIKs, or None if there is nothing left to claim.
+        """
+        now = time.time()
+        with self.lock:
+            self.connection.execute('BEGIN IMMEDIATE')
+            try:
+                row = self.connection.execute('''
+                    SELECT shard_id, ciks, node_id FROM shards
+                    WHERE status = 'pending' OR (status = 'leased' AND expires_at < ?)
+                    ORDER BY shard_id LIMIT 1''', (now,)).fetchone()
+                if row is not None:
+                    self.connection.execute('''
+                        UPDATE shards SET status = 'leased', node_id = ?, expires_at = ?, attempts = attempts + 1
+                        WHERE shard_id = ?''', (node_id, now + self.lease_seconds, row[0]))
+                self.connection.execute('COMMIT')
+            except Exception:
+                self.connection.execute('ROLLBACK')
+                raise
+
+        if row is None:
+            return None
+        if row[2] is not None and row[2] != node_id:
+            print(
+                f"Node: '{node_id}'| Reclaimed shard {row[0]} from expired node '{row[2]}'.")
+        return row[0], json.loads(row[1])
+
+    def heartbeat(self, node_id: str, shard_id: int) -> bool:
+        """
+        Extends the lease of a shard held by the node.
+
+        Parameters:
+        node_id (str): The node holding the shard.
+        shard_id (int): The shard ID.
+
+        Returns:
+        bool: False if the node no longer holds the lease.
+        """
+        with self.lock:
+            cursor = self.connection.execute('''
+                UPDATE shards SET expires_at = ?
+                WHERE shard_id = ? AND node_id = ? AND status = 'leased' ''',
+                                             (time.time() + self.lease_seconds, shard_id, node_id))
+        return cursor.rowcount == 1
+
+    def complete(self, node_id: str, shard_id: int) -> bool:
+        """
+        Marks a shard held by the node as done.
+
+        Parameters:
+        node_id (str): The node holding the shard.
+        shard_id (int): The shard ID.
+
+        Returns:
+        bool: False if the node no longer holds the lease.
+        """
+        with self.lock:
+            cursor = self.connection.execute('''
+                UPDATE shards SET status = 'done', expires_at = NULL
+                WHERE shard_id = ? AND node_id = ? AND status = 'leased' ''', (shard_id, node_id))
+        return cursor.rowcount == 1
+
+    def release(self, node_id: str, shard_id: int) -> None:
+        """
+        Gives back a shard held by the node so another node can claim it right away.
+
+        Parameters:
+        node_id (str): The node holding the shard.
+        shard_id (int): The shard ID.
+        """
+        with self.lock:
+            self.connection.execute('''
+                UPDATE shards SET status = 'pending', node_id = NULL, expires_at = NULL
+                WHERE shard_id = ? AND node_id = ? AND status = 'leased' ''', (shard_id, node_id))
+
+    def status(self) -> dict:
+        """
+        Counts the shards by status.
+
+        Returns:
+        dict: The number of shards for each status.
+        """
+        with self.lock:
+            rows = self.connection.execute(
+                'SELECT status, COUNT(*) FROM shards GROUP BY status').fetchall()
+        return dict(rows)
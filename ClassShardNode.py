@@ -0,0 +1,168 @@
+import os
+import uuid
+import shutil
+import threading
+from multiprocessing import Pool
+from functools import partial
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from ClassForm4 import Form4
+from ClassShardLease import ShardLease
+from ClassOwnershipLedger import OwnershipLedger
+from ClassInsiderGraph import InsiderGraph
+from ClassTradingData import TradingData
+
+
+class ShardNode:
+    # datasets written by the nodes, with their unique key column
+    datasets = [
+        ('form4/data', 'hash'),
+        ('form4/scraped_operation_ids', 'operation_id'),
+        ('trading-data', 'hash'),
+    ]
+
+    def __init__(self, node_id: str, lease: ShardLease, start_date: str = None, end_date: str = None, days_range: int = 0,
+                 parallel_exc: int = 2, max_requests_per_second: float = 5, heartbeat_interval: int = 60,
+                 nodes_path: str = 'system/nodes', shared_system_path: str = 'system') -> None:
+        """
+        Initializes a new instance of the ShardNode class, a node that claims CIK shards from a lease store and extracts their trading data.
+
+        Parameters:
+        node_id (str): The unique name of the node.
+        lease (ShardLease): The lease store shared by all the nodes.
+        start_date (str, optional): The start date to filter the search results by. Must be in YYYY-MM-DD format. Defaults to None.
+        end_date (str, optional): The end date to filter the search results by. Must be in YYYY-MM-DD format. Defaults to None.
+        days_range (int, optional): Defaults to 0.
+        parallel_exc (int, optional): Number of worker processes of the node. Defaults to 2.
+        max_requests_per_second (float, optional): SEC request budget of the node, split evenly between its workers. Defaults to 5.
+        heartbeat_interval (int, optional): Seconds between two lease heartbeats. Must be lower than the lease duration. Defaults to 60.
+        nodes_path (str, optional): The directory holding the system data of each node. Defaults to 'system/nodes'.
+        shared_system_path (str, optional): The shared system data the nodes are merged into. Its scraped operations are skipped. Defaults to 'system'.
+        """
+        self.node_id = node_id
+        self.lease = lease
+        self.start_date = start_date
+        self.end_date = end_date
+        self.days_range = days_range
+        self.parallel_exc = parallel_exc
+        self.max_requests_per_second = max_requests_per_second
+        self.heartbeat_interval = heartbeat_interval
+        self.system_path = nodes_path + '/' + node_id
+        self.shared_system_path = shared_system_path
+
+    @ staticmethod
+    def init_worker(max_requests_per_second: float) -> None:
+        Form4.max_requests_per_second = max_requests_per_second
+
+    @ staticmethod
+    def extract_trading_data(cik, start_date=None, end_date=None, days_range=0, system_path='system', shared_system_path='system'):
+        TradingData(cik, start_date, end_date, days_range,
+                    system_path=system_path, shared_system_path=shared_system_path)
+
+    def keep_alive(self, shard_id: int, stop: threading.Event) -> None:
+        # send heartbeats until the shard is done
+        while not stop.wait(self.heartbeat_interval):
+            if not self.lease.heartbeat(self.node_id, shard_id):
+                print(
+                    f"Node: '{self.node_id}'| Lost the lease of shard {shard_id}.")
+                return
+
+    def run(self) -> int:
+        """
+        Claims and processes shards until none is left.
+
+        Returns:
+        int: The number of shards processed by the node.
+        """
+        processed = 0
+        extract = partial(ShardNode.extract_trading_data, start_date=self.start_date, end_date=self.end_date,
+                          days_range=self.days_range, system_path=self.system_path,
+                          shared_system_path=self.shared_system_path)
+        with Pool(processes=self.parallel_exc, initializer=ShardNode.init_worker,
+                  initargs=(self.max_requests_per_second / self.parallel_exc,)) as pool:
+            while True:
+                shard = self.lease.claim(self.node_id)
+                if shard is None:
+                    break
+                shard_id, ciks = shard
+                print(
+                    f"Node: '{self.node_id}'| Processing shard {shard_id} with {len(ciks)} CIKs.")
+
+                stop = threading.Event()
+                heartbeat = threading.Thread(
+                    target=self.keep_alive, args=(shard_id, stop), daemon=True)
+                heartbeat.start()
+                try:
+                    pool.map(extract, ciks)
+                except Exception:
+                    self.lease.release(self.node_id, shard_id)
+                    raise
+                finally:
+                    stop.set()
+                    heartbeat.join()
+
+                if self.lease.complete(self.node_id, shard_id):
+                    processed += 1
+            pool.close()
+            pool.join()
+        print(f"Node: '{self.node_id}'| Processed {processed} shards.")
+        return processed
+
+    @ staticmethod
+    def merge(nodes_path: str = 'system/nodes', system_path: str = 'system') -> None:
+        """
+        Moves the rows written by every node into the shared system data, skipping rows whose key is already there.
+
+        Parameters:
+        nodes_path (str, optional): The directory holding the system data of each node. Defaults to 'system/nodes'.
+        system_path (str, optional): The shared system data. Defaults to 'system'.
+        """
+        if not os.path.isdir(nodes_path):
+            return
+
+        for node_id in sorted(os.listdir(nodes_path)):
+            for dataset, key in ShardNode.datasets:
+                node_dataset_path = os.path.join(nodes_path, node_id, dataset)
+                if not os.path.isdir(node_dataset_path):
+                    continue
+
+                for partition in sorted(os.listdir(node_dataset_path)):
+                    node_partition_path = os.path.join(
+                        node_dataset_path, partition)
+                    partition_path = os.path.join(
+                        system_path, dataset, partition)
+                    if dataset == 'form4/data':
+                        cik = partition.split('=')[1]
+                        Form4.migrate_partition(
+                            os.path.join(nodes_path, node_id, dataset), cik)
+                        Form4.migrate_partition(
+                            os.path.join(system_path, dataset), cik)
+
+                    existing_keys = pa.array([], pa.string())
+                    if os.path.isdir(partition_path):
+                        existing_keys = pq.read_table(
+                            partition_path, columns=[key]).column(key).combine_chunks().cast(pa.string())
+                    os.makedirs(partition_path, exist_ok=True)
+
+                    merged_rows = 0
+                    for file_name in sorted(os.listdir(node_partition_path)):
+                        if not file_name.endswith('.parquet'):
+                            continue
+                        table = pq.read_table(
+                            os.path.join(node_partition_path, file_name))
+                        table = table.filter(pc.invert(
+                            pc.is_in(table.column(key), value_set=existing_keys)))
+                        if table.num_rows > 0:
+                            pq.write_table(table, os.path.join(
+                                partition_path, uuid.uuid4().hex + '-0.parquet'))
+                            existing_keys = pa.concat_arrays(
+                                [existing_keys, table.column(key).combine_chunks().cast(pa.string())])
+                            merged_rows += table.num_rows
+                    print(
+                        f"Node: '{node_id}'| Merged {merged_rows} rows into {dataset}/{partition}.")
+                    if dataset == 'form4/data' and merged_rows > 0:
+                        OwnershipLedger(system_path).rebuild(cik)
+                        InsiderGraph(system_path).update([cik])
+
+            shutil.rmtree(os.path.join(nodes_path, node_id))
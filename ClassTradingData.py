@@ -1,26 +1,44 @@
 import os
 import pandas as pd
-import yfinance as yf
-import plotly.graph_objects as go
-import plotly.subplots as sp
-from typing import List
 import pyarrow as pa
 from ClassForm4 import Form4
-import plotly.express as px
+# yfinance and plotly are imported by the methods that use them, so scrape-only runs don't load them
 
 
 class TradingData:
-    def __init__(self, cik: str, start_date: str = None, end_date: str = None, days_range: int = 0) -> None:
+    # days after which a transaction without any price of a successfully downloaded ticker is recorded without price
+    settle_days = 7
+    # schema of the trading-data lake
+    pa_schema = pa.schema([
+        pa.field('parent_cik', pa.int64()),
+        pa.field('hash', pa.string()),
+        pa.field('open', pa.float64()),
+        pa.field('high', pa.float64()),
+        pa.field('low', pa.float64()),
+        pa.field('close', pa.float64()),
+        pa.field('adj_close', pa.float64()),
+        pa.field('volume', pa.float64()),
+        pa.field('daily_return', pa.float64()),
+        pa.field('percent_change', pa.float64()),
+        pa.field('range', pa.float64()),
+        pa.field('average_price', pa.float64()),
+        pa.field('shares_value_usd', pa.float64()),
+    ])
+
+    def __init__(self, cik: str, start_date: str = None, end_date: str = None, days_range: int = 0, system_path: str = 'system', shared_system_path: str = None) -> None:
         self.cik = cik
-        self.form4 = Form4(cik, start_date, end_date, days_range)
-        self.data = self.form4.data
+        self.form4 = Form4(cik, start_date, end_date,
+                           days_range, system_path=system_path, shared_system_path=shared_system_path)
+        # compact Form 4 rows, with the stock data once added
+        self.frame = self.form4.frame
+        self._data = None
         self.start_date = self.form4.start_date
         self.end_date = self.form4.end_date
         pd.set_option('display.max_columns', None)
         pd.set_option('display.max_rows', None)
 
-        if len(self.data) > 0:
-            self.parquet_path = 'system/trading-data'
+        if self.frame is not None and len(self.frame) > 0:
+            self.parquet_path = system_path + '/trading-data'
             self.add_stock_data()
             try:
                 self.record_data()
@@ -29,6 +47,16 @@ class TradingData:
         else:
             print(f"No data to save for {self.cik}")
 
+    @property
+    def data(self) -> list:
+        """
+        The Form 4 data and stock data as a list of dictionaries, materialized from `frame` on first access.
+        """
+        if self._data is None:
+            self._data = Form4.expand_frame(self.frame).to_dict(
+                orient='records') if self.frame is not None else []
+        return self._data
+
     @ staticmethod
     def add_close_market_days(stock_prices_df):
         # loop over each stock ticker in the DataFrame
@@ -66,80 +94,130 @@ class TradingData:
 
         return filled_stock_prices_df
 
+    def read_recorded_data(self) -> pd.DataFrame:
+        """
+        Reads the stock data already recorded for the CIK, one row per hash.
+        """
+        if not os.path.isdir(self.parquet_path + '/parent_cik=' + self.form4.cik):
+            return pd.DataFrame(columns=TradingData.pa_schema.names)
+        df = pd.read_parquet(path=self.parquet_path, engine='pyarrow', schema=TradingData.pa_schema,
+                             filters=[('parent_cik', '=', int(self.form4.cik))])
+        return df.drop_duplicates(subset=['hash'])
+
     def add_stock_data(self) -> None:
         """
         Adds stock data to the Form 4 data and updates the Form4 instance.
+        Only the transactions missing from the trading-data lake are priced, the others take their recorded stock data.
         """
+        df = self.frame
+        df = df[df['ticker'].notnull()]
 
-        df = pd.DataFrame(self.data)
+        self.recorded_df = self.read_recorded_data()
+        recorded = df['hash'].isin(self.recorded_df['hash'])
+        new_df = df[~recorded]
+        print(
+            f"CIK: '{self.form4.cik}'| Pricing {len(new_df)} new transactions.")
+        new_df, settled = TradingData.price_transactions(new_df)
+        # Unsettled rows are not recorded, so they are priced again by the next run
+        self.new_hashes = set(new_df.loc[settled, 'hash'])
+
+        recorded_df = self.recorded_df.drop(columns=['parent_cik'])
+        df = pd.concat([new_df, df[recorded].merge(recorded_df, how='left', on='hash')],
+                       ignore_index=True)
+        float_columns = df.select_dtypes(include='float').columns
+        df[float_columns] = df[float_columns].round(4)
+
+        self.frame = Form4.compact_frame(df)
+        self._data = None
+
+    @ staticmethod
+    def price_transactions(df: pd.DataFrame) -> tuple:
+        """
+        Downloads the stock prices of the transactions' tickers over their dates and adds the stock data columns.
+
+        Parameters:
+        df (DataFrame): Form 4 transactions with a datetime 'transaction_date'.
+
+        Returns:
+        tuple: The transactions with the stock data columns, NaN where no price was found, and a boolean Series telling
+        which ones are settled: priced, or without price although their ticker was downloaded without error, before
+        its last bar and more than settle_days ago. The others failed to download or are too recent, and can be retried.
+        """
+        import yfinance as yf
 
-        df = df[df['ticker'].notnull()]
-        df['transaction_date'] = pd.to_datetime(
-            df['transaction_date'], format='%Y-%m-%d')
-        min_max_dates = df.groupby('ticker').agg(min_date=('transaction_date', 'min'),
-                                                 max_date=('transaction_date', 'max')).reset_index()
-        # create a dictionary with Ticker as the key and min/max dates as the value
-        stock_date_dict = dict(zip(min_max_dates['ticker'], zip(
-            min_max_dates['min_date'], min_max_dates['max_date'])))
-        # create a list of unique tickers in the dataframe
-        tickers = df['ticker'].unique()
         stock_prices_df = pd.DataFrame(
             columns=['Date', 'Open', 'High', 'Low', 'Close', 'Adj Close', 'Volume', 'stock_ticker'])
-        good_ticker = []
-        bad_ticker = []
+        min_max_dates = df.groupby('ticker', observed=True).agg(min_date=('transaction_date', 'min'),
+                                                 max_date=('transaction_date', 'max')).reset_index()
+        # last bar of each ticker downloaded without error, NaT when it has no bar in the range
+        last_bars = {}
         # loop over each ticker to get the stock prices data from yfinance and append it to the stock prices dataframe
-        for ticker in tickers:
-            min_date, max_date = stock_date_dict[ticker]
-            # Holidays and weekends missing
-            ticker_history_n = yf.download(
-                ticker, start=min_date, end=max_date)
-
-            if not ticker_history_n.empty:
-                good_ticker.append(ticker)
+        for ticker, min_date, max_date in zip(min_max_dates['ticker'], min_max_dates['min_date'], min_max_dates['max_date']):
+            # Start a week earlier so weekends and holidays can take the previous close, and include the last date
+            try:
+                ticker_history_n = yf.download(
+                    ticker, start=min_date - pd.Timedelta(days=7), end=max_date + pd.Timedelta(days=1))
+                # yfinance reports download errors there instead of raising
+                error = getattr(getattr(yf, 'shared', None), '_ERRORS', {}).get(str(ticker).upper())
+            except Exception as e:
+                ticker_history_n, error = pd.DataFrame(), str(e)
+
+            if ticker_history_n.empty:
+                # an empty range is only a definitive answer when yfinance says so
+                if error is None or 'No data found' in str(error):
+                    last_bars[ticker] = pd.NaT
+            else:
+                last_bars[ticker] = pd.Timestamp(ticker_history_n.index.max())
                 ticker_history_n['stock_ticker'] = ticker
                 ticker_history_n.reset_index(inplace=True)
                 stock_prices_df = pd.concat(
                     [stock_prices_df, ticker_history_n], ignore_index=True)
-            else:
-                bad_ticker.append(ticker)
 
-        if not stock_prices_df.empty:
-            stock_prices_df = stock_prices_df.rename(
-                columns={c: c.replace(' ', '_').lower() for c in stock_prices_df.columns})
+        df = df.copy()
+        if stock_prices_df.empty:
+            for col in TradingData.pa_schema.names[2:]:
+                df[col] = float('nan')
+            return df, TradingData.settled(df, last_bars)
 
-            stock_prices_df['date'] = pd.to_datetime(
-                stock_prices_df['date'], format='%Y-%m-%d')
+        stock_prices_df = stock_prices_df.rename(
+            columns={c: c.replace(' ', '_').lower() for c in stock_prices_df.columns})
 
-            stock_prices_df = TradingData.add_close_market_days(
-                stock_prices_df)
+        stock_prices_df['date'] = pd.to_datetime(
+            stock_prices_df['date'], format='%Y-%m-%d')
 
-            df['transaction_date'] = pd.to_datetime(
-                df['transaction_date'], format='%Y-%m-%d')
+        stock_prices_df = TradingData.add_close_market_days(
+            stock_prices_df)
 
-            df = pd.merge(df, stock_prices_df, how='left', left_on=[
-                'ticker', 'transaction_date'], right_on=['stock_ticker', 'date'])
+        df['ticker'] = df['ticker'].astype(str)
+        df = pd.merge(df, stock_prices_df, how='left', left_on=[
+            'ticker', 'transaction_date'], right_on=['stock_ticker', 'date'])
 
-            df = df.drop(['date', 'stock_ticker'], axis=1)
+        df = df.drop(['date', 'stock_ticker'], axis=1)
 
-            df['daily_return'] = (df['close'].astype(
-                float) - df['open'].astype(float)) / df['open'].astype(float)
-            df['percent_change'] = df['daily_return'].astype(float) * 100
-            df['range'] = df['high'].astype(
-                float) - df['low'].astype(float)
-            df['average_price'] = (df['high'].astype(
-                float) + df['low'].astype(float)) / 2
+        prices = df[['open', 'high', 'low', 'close', 'adj_close', 'volume']].astype(float)
+        df[prices.columns] = prices
+        df['daily_return'] = (prices['close'] - prices['open']) / prices['open']
+        df['percent_change'] = df['daily_return'] * 100
+        df['range'] = prices['high'] - prices['low']
+        df['average_price'] = (prices['high'] + prices['low']) / 2
+        df['shares_value_usd'] = df['average_price'] * df['shares'].astype(float)
+        return df, TradingData.settled(df, last_bars)
 
-            df['shares_value_usd'] = df['average_price'].astype(float) * \
-                df['shares'].astype(float)
-            for col_name, col_values in df.items():
-                if col_values.dtype == float:
-                    df[col_name] = col_values.apply(lambda x: round(x, 4))
-
-            self.data = df.to_dict(orient='records')
+    @ staticmethod
+    def settled(df: pd.DataFrame, last_bars: dict) -> pd.Series:
+        # priced, or definitively without price (see price_transactions)
+        tickers = df['ticker'].astype(str)
+        downloaded = tickers.isin([str(ticker) for ticker in last_bars])
+        last_bar = pd.to_datetime(tickers.map({str(ticker): bar for ticker, bar in last_bars.items()}))
+        cutoff = pd.Timestamp.today().normalize() - pd.Timedelta(days=TradingData.settle_days)
+        return df['close'].notnull() | (downloaded & (df['transaction_date'] < cutoff) &
+                                        ~(df['transaction_date'] > last_bar))
 
     def record_data(self):
 
-        df = pd.DataFrame(self.data)
+        # Only the rows priced by add_stock_data are new to the trading-data lake
+        # Settled rows without a price (no bar for a past date) are recorded with NaN, so they are not downloaded again
+        df = self.frame[self.frame['hash'].isin(self.new_hashes)].copy()
         # Define a dictionary with the data types for each column
         schema = {
             'cik': 'Int64',
@@ -162,7 +240,6 @@ class TradingData:
             'acquired_disposed_code': 'string',
             'shares_owned_following_transaction': 'float64',
             'direct_or_indirect_ownership': 'string',
-            'form4_link': 'string',
             'open': 'float64',
             'high': 'float64',
             'low': 'float64',
@@ -182,58 +259,27 @@ class TradingData:
             if col in df.columns:
                 df[col] = df[col].astype(dtype)
 
+        df = df[TradingData.pa_schema.names]
+
         # Check if the Parquet file already exists
-        if os.path.isdir(self.parquet_path + '/parent_cik=' + self.cik):
-            pa_schema = pa.schema([
-                pa.field('parent_cik', pa.int64()),
-                pa.field('hash', pa.string()),
-                pa.field('open', pa.float64()),
-                pa.field('high', pa.float64()),
-                pa.field('low', pa.float64()),
-                pa.field('close', pa.float64()),
-                pa.field('adj_close', pa.float64()),
-                pa.field('volume', pa.float64()),
-                pa.field('daily_return', pa.float64()),
-                pa.field('percent_change', pa.float64()),
-                pa.field('range', pa.float64()),
-                pa.field('average_price', pa.float64()),
-                pa.field('shares_value_usd', pa.float64()),
-            ])
-
-            # Read the existing data from the Parquet file
-            existing_df = pd.read_parquet(
-                path=self.parquet_path, engine='pyarrow', schema=pa_schema)
-            print(f"Existing df: {len(existing_df)}")
-            df = df[~df['hash'].isin(existing_df['hash'])].dropna()
-
-        df = df[['parent_cik',
-                'hash',
-                 'open',
-                 'high',
-                 'low',
-                 'close',
-                 'adj_close',
-                 'volume',
-                 'daily_return',
-                 'percent_change',
-                 'range',
-                 'average_price',
-                 'shares_value_usd'
-                 ]]
-
-        df.to_parquet(self.parquet_path, partition_cols=[
-            'parent_cik'], engine='pyarrow')
+        if os.path.isdir(self.parquet_path + '/parent_cik=' + self.form4.cik):
+            print(f"Existing df: {len(self.recorded_df)}")
+            df = df[~df['hash'].isin(self.recorded_df['hash'])]
+
+        if len(df) > 0:
+            df.to_parquet(self.parquet_path, partition_cols=[
+                'parent_cik'], engine='pyarrow')
 
     def stacked_bar_acquired_disposed_by_insider(self):
         '''
         This will create a stacked bar chart showing the total number of shares acquired (A) and disposed (D) by each insider.
         '''
-        # Convert list of dictionaries to Pandas DataFrame
-        df = pd.DataFrame(self.data)
-        company_name = str(df['name'][0]).upper()
+        import plotly.express as px
+        df = self.frame
+        company_name = str(df['name'].iloc[0]).upper()
         # Group by insider and sum shares acquired/disposed
         grouped = df.groupby(['rptOwnerName', 'acquired_disposed_code'],
-                             as_index=False).agg({'shares': 'sum'})
+                             as_index=False, observed=True).agg({'shares': 'sum'})
 
         # Pivot table to create bar chart
         pivot = pd.pivot_table(grouped, values='shares',
@@ -246,12 +292,15 @@ class TradingData:
         fig.show()
 
     def stacked_bar_insider_ownership(self):
-
-        # Convert list of dictionaries to Pandas DataFrame
-        df = pd.DataFrame(self.data)
-        company_name = str(df['name'][0]).upper()
-        # Group by insider and sum shares owned following transaction
-        grouped = df.groupby(['rptOwnerName', 'direct_or_indirect_ownership'], as_index=True).agg(
+        '''
+        This will create a stacked bar chart showing the direct and indirect shares held by each insider at the end date.
+        '''
+        import plotly.express as px
+        company_name = str(self.frame['name'].iloc[0]).upper()
+        # Latest balance of each insider, security and ownership nature from the ownership ledger
+        as_of_date = self.end_date if self.end_date is not None else pd.Timestamp.today()
+        balances = self.form4.ownership_ledger.as_of(self.form4.cik, as_of_date)
+        grouped = balances.groupby(['rptOwnerName', 'direct_or_indirect_ownership'], as_index=True).agg(
             {'shares_owned_following_transaction': 'sum'})
 
         # Pivot table to create bar chart
@@ -263,7 +312,7 @@ class TradingData:
 
         # Create stacked bar chart
         fig = px.bar(pivot, x=pivot.index, y=column_names, barmode='stack',
-                     title=f'{company_name} ({self.start_date} to {self.end_date}) - Insider Ownership', color_discrete_sequence=['#636EFA', '#EF553B'])
+                     title=f'{company_name} (as of {pd.Timestamp(as_of_date).date()}) - Insider Ownership', color_discrete_sequence=['#636EFA', '#EF553B'])
 
         # Display chart
         fig.show()
@@ -272,14 +321,13 @@ class TradingData:
         """
         Generates a plot of the inside trading impact over time.
         """
-        # Convert input data to Pandas DataFrame
-        df = pd.DataFrame(self.data)
-        company_name = str(df['name'][0]).upper()
-        df['transaction_date'] = pd.to_datetime(
-            df['transaction_date'], format='%Y-%m-%d')
+        import plotly.graph_objects as go
+        import plotly.subplots as sp
+        df = self.frame
+        company_name = str(df['name'].iloc[0]).upper()
 
         # Group by transaction date and sum the inside trading volume for each day and acquired/disposed code
-        trading_volume_df = df.groupby(["transaction_date", "acquired_disposed_code"], as_index=False).agg({"shares_value_usd": "sum"}).rename(
+        trading_volume_df = df.groupby(["transaction_date", "acquired_disposed_code"], as_index=False, observed=True).agg({"shares_value_usd": "sum"}).rename(
             columns={"shares_value_usd": "inside_trading_volume"})
 
         # Create separate DataFrame for stock closing price
@@ -1,9 +1,21 @@
 from ClassTradingData import TradingData
 from ClassForm4 import Form4
-from multiprocessing import Pool
+import multiprocessing
 from functools import partial
 import time
 
+# modules imported once by the forkserver, so its workers start with them loaded
+# the helpers below import the classes they need, so the workers don't load their dependencies
+preload_modules = ['__main__', 'ClassForm4', 'ClassTradingData']
+
+
+def get_pool_context(start_method=None):
+    # 'forkserver' forks every worker from a server process that preloaded the modules
+    context = multiprocessing.get_context(start_method)
+    if start_method == 'forkserver':
+        context.set_forkserver_preload(preload_modules)
+    return context
+
 
 def extract_trading_data(cik, start_date=None, end_date=None, days_range=0):
     tradingData = TradingData(
@@ -11,11 +23,11 @@ def extract_trading_data(cik, start_date=None, end_date=None, days_range=0):
     return tradingData
 
 
-def parallel_extract_trading_data(ciks, start_date=None, end_date=None, days_range=0, parallel_exc=2):
+def parallel_extract_trading_data(ciks, start_date=None, end_date=None, days_range=0, parallel_exc=2, start_method=None):
     if parallel_exc > 1:
         batch_delay = 1/parallel_exc
         # create a pool of processes
-        with Pool(processes=parallel_exc) as pool:
+        with get_pool_context(start_method).Pool(processes=parallel_exc) as pool:
             # create a partial function with the start_date and end_date arguments fixed
             create_data_pool = partial(
                 extract_trading_data, start_date=start_date, end_date=end_date, days_range=days_range)
@@ -38,11 +50,11 @@ def extract_form4(cik, start_date=None, end_date=None, days_range=0):
     return form4Data
 
 
-def parallel_extract_form4_data(ciks, start_date=None, end_date=None, days_range=0, parallel_exc=2):
+def parallel_extract_form4_data(ciks, start_date=None, end_date=None, days_range=0, parallel_exc=2, start_method=None):
     if parallel_exc > 1:
         batch_delay = 1/parallel_exc
         # create a pool of processes
-        with Pool(processes=parallel_exc) as pool:
+        with get_pool_context(start_method).Pool(processes=parallel_exc) as pool:
             # create a partial function with the start_date and end_date arguments fixed
             create_data_pool = partial(
                 extract_form4, start_date=start_date, end_date=end_date, days_range=days_range)
@@ -57,6 +69,81 @@ def parallel_extract_form4_data(ciks, start_date=None, end_date=None, days_range
             pool.join()
 
 
+def watch_form4_feed(ciks, interval=60, iterations=None, feed_url=None):
+    # poll the latest filings feed and scrape only the new Form 4 filings of the given ciks
+    from ClassEdgarFeed import EdgarFeed
+    feed = EdgarFeed(ciks, feed_url=feed_url)
+    feed.watch(interval=interval, iterations=iterations)
+    return feed
+
+
+def pipeline_extract_form4_data(ciks, start_date=None, end_date=None, days_range=0, io_workers=4, parse_workers=None, queue_size=64):
+    # download with io_workers threads, parse in a process pool and sync from a single writer
+    from ClassForm4Pipeline import Form4Pipeline
+    pipeline = Form4Pipeline(ciks, start_date, end_date, days_range,
+                             io_workers=io_workers, parse_workers=parse_workers, queue_size=queue_size)
+    pipeline.run()
+
+
+def distributed_extract_trading_data(ciks, node_id, lease_path='system/leases.sqlite', start_date=None, end_date=None, days_range=0, parallel_exc=2, max_requests_per_second=5, shard_size=10, nodes_path='system/nodes', shared_system_path='system'):
+    # claim shards of ciks shared with other nodes through the lease store and write them to this node's system data
+    from ClassShardLease import ShardLease
+    from ClassShardNode import ShardNode
+    lease = ShardLease(lease_path)
+    lease.add_shards(ciks, shard_size=shard_size)
+    node = ShardNode(node_id, lease, start_date, end_date, days_range,
+                     parallel_exc=parallel_exc, max_requests_per_second=max_requests_per_second,
+                     nodes_path=nodes_path, shared_system_path=shared_system_path)
+    node.run()
+    return lease.status()
+
+
+def merge_nodes_data(nodes_path='system/nodes', system_path='system'):
+    # unify the system data written by every node once all the shards are done
+    from ClassShardNode import ShardNode
+    ShardNode.merge(nodes_path, system_path)
+
+
+def export_form4_data(path, format='csv', ciks=None, start_date=None, end_date=None, tickers=None, enrich=False, per_partition=False):
+    # stream a selection of the Form 4 lake to csv, parquet or arrow without scraping
+    from ClassForm4Export import Form4Export
+    export = Form4Export(ciks, start_date, end_date, tickers, enrich=enrich)
+    return export.export(path, format=format, per_partition=per_partition)
+
+
+def reparse_form4_data(ciks=None, archive_path='system/raw-archive', rebuild=True):
+    # rebuild the Form 4 lake from the raw documents archived by previous scrapes
+    from ClassFilingArchive import FilingArchive
+    archive = FilingArchive(archive_path)
+    archive.reparse(ciks, rebuild=rebuild)
+
+
+def serve_queries(host='127.0.0.1', port=8000, refresh_interval=30):
+    # serve the lakes from memory over HTTP/JSON, reloading the CIKs that get new Parquet files
+    from ClassQueryService import QueryService
+    service = QueryService(refresh_interval=refresh_interval)
+    service.serve(host, port)
+
+
+def migrate_system_data(system_path='system'):
+    # bring a lake written by an older version to the compact schema, while no sync is running
+    from ClassForm4 import Form4
+    Form4.migrate_system_data(system_path + '/form4/data')
+
+
+def rebuild_ownership_ledgers(system_path='system'):
+    # rebuild the post-transaction balances of every CIK, e.g. for a lake synced before the ledger existed
+    from ClassOwnershipLedger import OwnershipLedger
+    return OwnershipLedger(system_path).rebuild_all()
+
+
+def index_insiders(ciks=None, system_path='system'):
+    # index the owners of the lake files written since the last update, e.g. after a copy of the lake
+    from ClassInsiderGraph import InsiderGraph
+    graph = InsiderGraph(system_path)
+    return graph.update(ciks)
+
+
 if __name__ == '__main__':
     start_time = time.time()
     start_date = '2021-01-01'